@@ -15,7 +15,7 @@ async def convert_csv_to_json(file: UploadFile = File(...),
     try:
         logging.info("Received request to /convert_csv_to_json/")
         csv_data = csv_to_export_json(
-            file,
+            file.file,
             pov_dimensions,
             pov_dimension_members,
             col_dimensions,
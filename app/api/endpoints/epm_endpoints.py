@@ -1,13 +1,30 @@
 import json
 
+import httpx
+from starlette.exceptions import HTTPException as StarletteHTTPException
 from starlette.responses import PlainTextResponse
 
 from app.core.epm_functions import *
-from fastapi import APIRouter, HTTPException, Body, UploadFile, File, Form, requests
+from fastapi import APIRouter, HTTPException, Body, UploadFile, File, Form
 
 router = APIRouter()
 
 
+def raise_epm_error(action, e):
+    """
+    Re-raise an error from an EPM call as an HTTPException: EPM error responses keep
+    their status code, timeouts become 504 and other connection failures 502.
+    """
+    logging.error(f"Error in {action}: {e}")
+    if isinstance(e, StarletteHTTPException):
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    if isinstance(e, httpx.TimeoutException):
+        raise HTTPException(status_code=504, detail=f"EPM request timed out: {e}")
+    if isinstance(e, httpx.HTTPError):
+        raise HTTPException(status_code=502, detail=f"EPM request failed: {e}")
+    raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.post("/export_data_slice_json/")
 async def epm_export_data_slice_json(
         base_url: str = Form(...),
@@ -16,13 +33,19 @@ async def epm_export_data_slice_json(
         app_name: str = Form(...),
         api_version: str = Form(...),
         plan_type_name: str = Form(...),
-        payload: str = Form(...)  # Accepting payload as a string
+        payload: str = Form(...),  # Accepting payload as a string
+        max_cells: int = Form(None),  # Split the grid into sub-slices of at most this many cells
+        split_dimension: str = Form(None),  # Row or POV dimension to split the grid on
+        max_workers: int = Form(DEFAULT_SLICE_WORKERS),  # Sub-slices exported concurrently
+        cache: bool = Form(False),  # Serve a repeated export from the export cache
+        refresh_cache: bool = Form(False)  # Skip the cached result and replace it
 ):
     try:
         logging.info("Received request to export data from epm")
-        export_data_slice_json(base_url, username, password, app_name, api_version, plan_type_name, payload)
+        return await export_data_slice_json(base_url, username, password, app_name, api_version, plan_type_name,
+                                            payload, max_cells, split_dimension, max_workers, cache, refresh_cache)
     except Exception as e:
-        logging.error(f"Error in export data: {e}")
+        raise_epm_error("export data", e)
 
 
 @router.post("/import_data_slice_json/")
@@ -33,18 +56,21 @@ async def epm_import_data_slice_json(
         app_name: str = Form(...),
         api_version: str = Form(...),
         plan_type_name: str = Form(...),
-        payload: str = Form(...)  # Accepting payload as a string or a file
+        payload: str = Form(...),  # Accepting payload as a string or a file
+        batch_size: int = Form(None),  # Send the dataGrid rows in batches of this size
+        max_workers: int = Form(DEFAULT_SLICE_WORKERS),  # Batches imported concurrently
+        max_retries: int = Form(DEFAULT_IMPORT_RETRIES)  # Retries for each failed batch
 ):
     try:
         logging.info("Received request to import data to epm")
-        import_data_slice_json (base_url, username, password, app_name, api_version, plan_type_name, payload)
+        return await import_data_slice_json(base_url, username, password, app_name, api_version, plan_type_name,
+                                            payload, batch_size, max_workers, max_retries)
     except Exception as e:
-        logging.error(f"Error in import data: {e}")
+        raise_epm_error("import data", e)
 
 
 @router.post("/run_job/")
-async def run_job(
-        background_tasks: BackgroundTasks,
+async def epm_run_job(
         base_url: str = Form(...),
         api_version: str = Form(...),
         application: str = Form(...),
@@ -53,12 +79,19 @@ async def run_job(
         username: str = Form(...),
         password: str = Form(...),
         parameters: str = Form(None),  # Accepting parameters as a JSON string
-        poll_interval: int = Form(10),  # Default poll interval in seconds
-        max_retries: int = Form(30)  # Default maximum number of retries
+        poll_interval: int = Form(DEFAULT_POLL_INTERVAL),  # Initial poll interval in seconds
+        max_retries: int = Form(DEFAULT_MAX_POLLS)  # Maximum number of status polls
 ):
     try:
         logging.info("Received request to run a job")
-        run_job(background_tasks, base_url, api_version, application, job_type, job_name, username, password, parameters, poll_interval, max_retries)
+        return await run_job(base_url, api_version, application, job_type, job_name, username, password, parameters, poll_interval, max_retries)
     except Exception as e:
-        logging.error(f"Error in run job: {e}")
+        raise_epm_error("run job", e)
+
 
+@router.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    record = job_tracker.registry.get(job_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    return record
@@ -1,16 +1,47 @@
-from starlette.responses import PlainTextResponse
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, StreamingResponse
 
 from app.core.json_functions import *
 from fastapi import APIRouter, HTTPException, Body
 router = APIRouter()
 
 
+class RequestBodyReader:
+    """
+    Exposes a request body as an object with an async read(), as ijson expects.
+    """
+
+    def __init__(self, request: Request):
+        self._chunks = request.stream()
+        self._pending = b''
+
+    async def read(self, size=-1):
+        while size < 0 or len(self._pending) < size:
+            try:
+                self._pending += await self._chunks.__anext__()
+            except StopAsyncIteration:
+                break
+        if size < 0:
+            data, self._pending = self._pending, b''
+        else:
+            data, self._pending = self._pending[:size], self._pending[size:]
+        return data
+
+
 @router.post("/convert_json_to_csv/", response_class=PlainTextResponse)
-async def convert_json_to_csv(json_payload: dict):
+async def convert_json_to_csv(request: Request):
+    logging.info("Received request to /convert_json_to_csv/")
+    csv_chunks = aiter_csv_chunks(aiter_grid_items_stream(RequestBodyReader(request)))
     try:
-        logging.info("Received request to /convert_json_to_csv/")
-        csv_data = json_to_csv(json_payload)
-        return csv_data
+        # Parse far enough to surface malformed JSON as a 400 before the response starts
+        first_chunk = await csv_chunks.__anext__()
     except Exception as e:
         logging.error(f"Error in /convert_json_to_csv/: {e}")
         raise HTTPException(status_code=400, detail=str(e))
+
+    async def stream_csv():
+        yield first_chunk
+        async for text in csv_chunks:
+            yield text
+
+    return StreamingResponse(stream_csv(), media_type="text/plain")
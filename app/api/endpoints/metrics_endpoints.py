@@ -0,0 +1,16 @@
+from starlette.responses import PlainTextResponse
+
+from app.core.export_cache import export_cache
+from app.core.instrumentation import stage_metrics
+from fastapi import APIRouter
+
+router = APIRouter()
+
+# Content type of the Prometheus text exposition format
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@router.get("")
+async def metrics():
+    return PlainTextResponse(stage_metrics.render_prometheus() + export_cache.render_prometheus(),
+                             media_type=PROMETHEUS_CONTENT_TYPE)
@@ -0,0 +1,45 @@
+from typing import List
+
+from app.api.endpoints.epm_endpoints import raise_epm_error
+from app.core.reconcile_functions import *
+from fastapi import APIRouter, Form
+
+router = APIRouter()
+
+
+@router.post("/")
+async def reconcile_slices(
+        src_base_url: str = Form(...),
+        src_username: str = Form(...),
+        src_password: str = Form(...),
+        src_app_name: str = Form(...),
+        src_api_version: str = Form(...),
+        src_plan_type_name: str = Form(...),
+        src_payload: str = Form(...),  # Source export payload as a JSON string
+        excel_path: str = Form(...),
+        row_dimensions: List[str] = Form(...),
+        # Target connection details default to the source ones when omitted
+        tgt_base_url: str = Form(None),
+        tgt_username: str = Form(None),
+        tgt_password: str = Form(None),
+        tgt_app_name: str = Form(None),
+        tgt_api_version: str = Form(None),
+        tgt_plan_type_name: str = Form(None),
+        tgt_payload: str = Form(None),
+        max_cells: int = Form(None),  # Split each export into sub-slices of at most this many cells
+        tolerance: float = Form(0.0),  # Absolute difference treated as a match
+        streaming: bool = Form(False),  # Write the workbook in a single constant-memory pass
+        skip_on_match: bool = Form(False),  # Skip the workbook when source and target match
+        snapshot_dir: str = Form(None),  # Only compare intersections changed since the stored snapshot
+        cache: bool = Form(False)  # Serve repeated exports from the export cache
+):
+    try:
+        logging.info("Received request to /reconcile/")
+        source = build_reconcile_side(src_base_url, src_username, src_password, src_app_name, src_api_version,
+                                      src_plan_type_name, src_payload, max_cells, cache=cache)
+        target = build_reconcile_side(tgt_base_url, tgt_username, tgt_password, tgt_app_name, tgt_api_version,
+                                      tgt_plan_type_name, tgt_payload, max_cells, cache=cache, defaults=source)
+        return await reconcile(source, target, excel_path, row_dimensions, tolerance, streaming, skip_on_match,
+                               snapshot_dir)
+    except Exception as e:
+        raise_epm_error("/reconcile/", e)
@@ -1,41 +1,60 @@
+import asyncio
+import os
 from typing import List
 from urllib import request
 
 from starlette.responses import FileResponse, JSONResponse
 
 from app.core.xlsx_functions import *
-from fastapi import APIRouter, HTTPException, Body, UploadFile, File, Form
+from app.core.comparison_jobs import comparison_jobs
+from fastapi import APIRouter, HTTPException, Body, Depends, UploadFile, File, Form
 
 router = APIRouter()
 
 
+def comparison_options(
+    src_num_headers: int = Form(...),
+    tgt_num_headers: int = Form(...),
+    row_dimensions: List[str] = Form(...),  # This captures multiple row_dimensions form fields as a list
+    tolerance: float = Form(0.0),  # Absolute difference treated as a match
+    streaming: bool = Form(False),  # Write the workbook in a single constant-memory pass
+    skip_on_match: bool = Form(False),  # Skip the workbook when source and target match
+    columnar_format: str = Form(None),  # Also write Source/Target/Validation as 'parquet' or 'arrow'
+    write_excel: bool = Form(True),  # Set to false to only write the columnar outputs
+    snapshot_dir: str = Form(None),  # Only compare intersections changed since the stored snapshot
+    snapshot_key: str = Form(None),  # Snapshot name, e.g. application/plan type/POV
+    workers: int = Form(1),  # Number of processes to compare partitions in
+    rollup_depth: int = Form(None),  # Drill down through this many leading row dimensions' group totals first
+    long_format: bool = Form(False),  # Compare on a sparse long model of the non-missing cells
+    exceptions_only: bool = Form(False)  # Only write failing rows, with a Summary sheet
+    ):
+    """
+    Form fields shared by the comparison endpoints, as save_to_excel_with_hash_check
+    keyword arguments.
+    """
+    if not write_excel and not columnar_format:
+        raise HTTPException(status_code=422, detail="write_excel=false requires a columnar_format")
+    return dict(src_num_headers=src_num_headers, tgt_num_headers=tgt_num_headers, row_dimensions=row_dimensions,
+                tolerance=tolerance, streaming=streaming, skip_on_match=skip_on_match,
+                columnar_format=columnar_format, write_excel=write_excel, snapshot_dir=snapshot_dir,
+                snapshot_key=snapshot_key, workers=workers, rollup_depth=rollup_depth, long_format=long_format,
+                exceptions_only=exceptions_only)
+
+
 @router.post("/variance_csvs/")
 async def create_variance_csvs(
     data_pull_csv: UploadFile = File(...),
     comparison_csv: UploadFile = File(...),
     excel_path: str = Form(...),
-    src_num_headers: int = Form(...),
-    tgt_num_headers: int = Form(...),
-    row_dimensions: List[str] = Form(...)  # This captures multiple row_dimensions form fields as a list
+    options: dict = Depends(comparison_options)
     ):
-    # Read the content of the uploaded files
     try:
-        data_pull_content = await data_pull_csv.read()
-        comparison_content = await comparison_csv.read()
-
-        # You would typically save these files to disk or process them directly from memory
-        # For this example, we assume processing directly from memory, hence converting content to string
-        # Be sure to adjust your save_to_excel_with_hash_check function to work with file content or paths as necessary
-
-        # Assuming save_to_excel_with_hash_check is adjusted to work with the file content
-        status_code = save_to_excel_with_hash_check(
-            data_pull_content.decode('utf-8'),  # Decoding bytes to string
-            comparison_content.decode('utf-8'),  # Decoding bytes to string
-            excel_path,
-            src_num_headers,
-            tgt_num_headers,
-            row_dimensions
-        )
+        # Hand the spooled upload files straight to the core so large uploads stay on disk
+        data_pull_csv.file.seek(0)
+        comparison_csv.file.seek(0)
+        # Run the comparison in a worker thread so it does not block the event loop
+        status_code = await asyncio.to_thread(save_to_excel_with_hash_check, data_pull_csv.file,
+                                              comparison_csv.file, excel_path=excel_path, **options)
         return JSONResponse(status_code=200, content={"message": "Success", "status_code": status_code})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -43,3 +62,45 @@ async def create_variance_csvs(
         # It's important to close the files to free up resources
         await data_pull_csv.close()
         await comparison_csv.close()
+
+
+@router.post("/variance_jobs/")
+async def submit_variance_job(
+    data_pull_csv: UploadFile = File(...),
+    comparison_csv: UploadFile = File(...),
+    excel_path: str = Form(None),  # Defaults to a file in the job's working directory
+    options: dict = Depends(comparison_options)
+    ):
+    # Queue the comparison in the worker process pool and return its job id straight away
+    try:
+        data_pull_csv.file.seek(0)
+        comparison_csv.file.seek(0)
+        record = await asyncio.to_thread(comparison_jobs.submit, data_pull_csv.file, comparison_csv.file,
+                                         excel_path=excel_path, **options)
+        return JSONResponse(status_code=202, content=record)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        await data_pull_csv.close()
+        await comparison_csv.close()
+
+
+@router.get("/variance_jobs/{job_id}")
+async def get_variance_job(job_id: str):
+    record = comparison_jobs.get(job_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    return record
+
+
+@router.get("/variance_jobs/{job_id}/download")
+async def download_variance_job(job_id: str):
+    record = comparison_jobs.get(job_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    if record["state"] != "completed":
+        raise HTTPException(status_code=409, detail=f"Job {job_id} is {record['state']}")
+    if not os.path.exists(record["excelPath"]):
+        raise HTTPException(status_code=404, detail=f"Job {job_id} did not write a workbook")
+    return FileResponse(record["excelPath"], filename=os.path.basename(record["excelPath"]),
+                        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
@@ -1,18 +1,33 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 import uvicorn
-from fastapi import FastAPI
+from app.core.comparison_jobs import comparison_jobs
+from app.core.epm_client import close_epm_client
 from app.core.logging_engine import *
 
 from app.api.endpoints import json_endpoints  # adjust this import based on your actual path
 from app.api.endpoints import csv_endpoints
 from app.api.endpoints import epm_endpoints
 from app.api.endpoints import xlsx_endpoints
+from app.api.endpoints import reconcile_endpoints
+from app.api.endpoints import metrics_endpoints
+
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    # Release the pooled EPM connections and comparison workers on shutdown
+    await close_epm_client()
+    comparison_jobs.shutdown()
 
 
 def init_fastapi():
-    app = FastAPI()
+    app = FastAPI(lifespan=lifespan)
     app.include_router(json_endpoints.router, prefix="/json", tags=["json"])
     app.include_router(csv_endpoints.router, prefix="/csv", tags=["csv"])
     app.include_router(epm_endpoints.router, prefix="/epm", tags=["epm"])
     app.include_router(xlsx_endpoints.router, prefix="/xlsx", tags=["xlsx"])
+    app.include_router(reconcile_endpoints.router, prefix="/reconcile", tags=["reconcile"])
+    app.include_router(metrics_endpoints.router, prefix="/metrics", tags=["metrics"])
     uvicorn.run(app, host="0.0.0.0", port=8000)
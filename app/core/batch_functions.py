@@ -0,0 +1,130 @@
+import datetime
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from app.core.logging_engine import *
+
+DEFAULT_BATCH_WORKERS = 2
+
+# Manifest keys mapped to save_to_excel_with_hash_check arguments
+MANIFEST_ARGUMENTS = {
+    'source': 'data_pull_csv',
+    'target': 'comparison_csv',
+    'destination': 'excel_path',
+    'src_headers': 'src_num_headers',
+    'tgt_headers': 'tgt_num_headers',
+    'row_dimensions': 'row_dimensions',
+    'tolerance': 'tolerance',
+    'streaming': 'streaming',
+    'skip_on_match': 'skip_on_match',
+    'columnar_format': 'columnar_format',
+    'write_excel': 'write_excel',
+    'snapshot_dir': 'snapshot_dir',
+    'snapshot_key': 'snapshot_key',
+    'rollup_depth': 'rollup_depth',
+    'long_format': 'long_format',
+    'exceptions_only': 'exceptions_only',
+}
+PATH_KEYS = ('source', 'target', 'destination', 'snapshot_dir')
+REQUIRED_KEYS = ('source', 'target', 'destination', 'src_headers', 'tgt_headers', 'row_dimensions')
+
+
+def load_manifest(path):
+    """
+    Read a batch manifest from a JSON or YAML file.
+
+    The manifest holds a `comparisons` list, each entry naming a `source`, `target`,
+    `destination`, `src_headers`, `tgt_headers` and `row_dimensions` (a list or a
+    comma separated string), plus any other MANIFEST_ARGUMENTS key. Keys under
+    `defaults` apply to every entry that does not set them, and an optional `workers`
+    sets the concurrency. Relative paths are resolved against the manifest's directory.
+    """
+    with open(path) as manifest_file:
+        if os.path.splitext(path)[1].lower() in ('.yaml', '.yml'):
+            import yaml
+            manifest = yaml.safe_load(manifest_file)
+        else:
+            manifest = json.load(manifest_file)
+
+    if not isinstance(manifest, dict) or not isinstance(manifest.get('comparisons'), list):
+        raise ValueError(f"Manifest {path} has no 'comparisons' list")
+
+    base_dir = os.path.dirname(os.path.abspath(path))
+    defaults = manifest.get('defaults') or {}
+    comparisons = []
+    for i, entry in enumerate(manifest['comparisons']):
+        entry = dict(defaults, **entry)
+        name = str(entry.pop('name', f"comparison_{i + 1}"))
+        unknown = set(entry) - set(MANIFEST_ARGUMENTS)
+        if unknown:
+            raise ValueError(f"Comparison {name}: unknown keys {', '.join(sorted(unknown))}")
+        missing = [key for key in REQUIRED_KEYS if entry.get(key) is None]
+        if missing:
+            raise ValueError(f"Comparison {name}: missing {', '.join(missing)}")
+        if entry.get('write_excel') is False and not entry.get('columnar_format'):
+            raise ValueError(f"Comparison {name}: write_excel false requires a columnar_format")
+        for key in PATH_KEYS:
+            if entry.get(key) is not None:
+                entry[key] = os.path.join(base_dir, os.path.expanduser(str(entry[key])))
+        if isinstance(entry['row_dimensions'], str):
+            entry['row_dimensions'] = entry['row_dimensions'].split(',')
+        comparisons.append({'name': name, 'arguments': {MANIFEST_ARGUMENTS[k]: v for k, v in entry.items()}})
+    return {'workers': manifest.get('workers'), 'comparisons': comparisons}
+
+
+def run_batch_comparison(name, arguments):
+    """
+    Worker-process entry point: run one comparison of a batch and return its report
+    entry. Failures are reported rather than raised, so one bad pair does not stop
+    the batch.
+    """
+    # Imported here so the parent process of a batch never loads pandas
+    from app.core.xlsx_functions import save_to_excel_with_hash_check
+
+    timings = {}
+    started = time.perf_counter()
+    entry = {'name': name, 'source': arguments['data_pull_csv'], 'target': arguments['comparison_csv'],
+             'destination': arguments['excel_path']}
+    try:
+        os.makedirs(os.path.dirname(arguments['excel_path']) or '.', exist_ok=True)
+        entry['status_code'] = save_to_excel_with_hash_check(**arguments, timings=timings)
+        entry['status'] = 'matched' if entry['status_code'] == 200 else 'mismatched'
+    except Exception as e:
+        logging.error(f"Batch comparison {name} failed: {e}")
+        entry.update(status='failed', status_code=500, detail=str(e))
+    entry['seconds'] = round(time.perf_counter() - started, 4)
+    entry['timings'] = {stage: round(seconds, 4) for stage, seconds in timings.items()}
+    return entry
+
+
+def run_batch(manifest, workers=None):
+    """
+    Run every comparison of a loaded manifest in one process pool of `workers`
+    processes (the manifest's `workers`, or DEFAULT_BATCH_WORKERS) and return the
+    consolidated run report, with the entries in manifest order.
+    """
+    workers = workers or manifest.get('workers') or DEFAULT_BATCH_WORKERS
+    comparisons = manifest['comparisons']
+    started_at = datetime.datetime.now(datetime.timezone.utc)
+    started = time.perf_counter()
+
+    entries = [None] * len(comparisons)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run_batch_comparison, c['name'], c['arguments']): i
+                   for i, c in enumerate(comparisons)}
+        for future in as_completed(futures):
+            entry = future.result()
+            entries[futures[future]] = entry
+            logging.info(f"Batch comparison {entry['name']} {entry['status']} in {entry['seconds']:.2f}s")
+
+    summary = {status: sum(1 for e in entries if e['status'] == status)
+               for status in ('matched', 'mismatched', 'failed')}
+    return {
+        'startedAt': started_at.isoformat(),
+        'seconds': round(time.perf_counter() - started, 4),
+        'workers': workers,
+        'summary': summary,
+        'comparisons': entries,
+    }
@@ -0,0 +1,60 @@
+import os
+
+from app.core.logging_engine import *
+
+COLUMNAR_EXTENSIONS = {
+    '.parquet': 'parquet',
+    '.arrow': 'arrow',
+    '.feather': 'arrow',
+}
+COLUMNAR_FORMATS = ('parquet', 'arrow')
+
+
+def columnar_format_of(source):
+    """
+    Return 'parquet' or 'arrow' when `source` is a path to a columnar file, else None.
+    """
+    if not isinstance(source, (str, os.PathLike)) or '\n' in str(source):
+        return None
+    return COLUMNAR_EXTENSIONS.get(os.path.splitext(str(source))[1].lower())
+
+
+def read_columnar(path):
+    """
+    Load a frame saved by write_columnar, memory-mapping the file rather than reading it.
+    """
+    if columnar_format_of(path) == 'parquet':
+        import pandas as pd
+        return pd.read_parquet(path, memory_map=True)
+
+    import pyarrow.feather
+    return pyarrow.feather.read_table(path, memory_map=True).to_pandas()
+
+
+def columnar_output_path(excel_path, sheet_name, columnar_format):
+    """
+    Path of the columnar file written next to `excel_path` for one sheet, e.g.
+    recon.xlsx -> recon_Validation.parquet.
+    """
+    extension = '.parquet' if columnar_format == 'parquet' else '.arrow'
+    return f"{os.path.splitext(excel_path)[0]}_{sheet_name}{extension}"
+
+
+def write_columnar(excel_path, frames, columnar_format):
+    """
+    Write each frame of `frames` ({sheet name: DataFrame}) as Parquet or Arrow IPC next
+    to `excel_path` and return the paths written.
+    """
+    if columnar_format not in COLUMNAR_FORMATS:
+        raise ValueError(f"Unsupported columnar format: {columnar_format}")
+
+    paths = {}
+    for sheet_name, df in frames.items():
+        path = columnar_output_path(excel_path, sheet_name, columnar_format)
+        if columnar_format == 'parquet':
+            df.to_parquet(path, index=False)
+        else:
+            df.reset_index(drop=True).to_feather(path)
+        paths[sheet_name] = path
+    logging.info(f"Wrote {columnar_format} outputs: {', '.join(paths.values())}")
+    return paths
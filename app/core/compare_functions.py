@@ -0,0 +1,435 @@
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from app.core.instrumentation import span
+from app.core.logging_engine import *
+
+NOTE_MATCH = 'Data Match'
+NOTE_MISMATCH = 'Values do not match'
+NOTE_SOURCE_ONLY = 'Data exists in source, not in target'
+NOTE_TARGET_ONLY = 'Data exists in target, not in source'
+
+
+def get_measure_columns(comparison_df):
+    """
+    Return the measure names present on both sides of a joined frame, in column order.
+    """
+    return [c[:-len('_source')] for c in comparison_df.columns if c.endswith('_source')]
+
+
+def compute_variances(comparison_df, tolerance=0.0):
+    """
+    Add <col>_variance, <col>_notes and rowfailure columns to a frame produced by
+    joining source and target with the '_source' / '_target' suffixes.
+
+    Differences whose absolute value is within `tolerance` are treated as a match
+    when both sides hold a value, so float rounding noise is not reported.
+    """
+    measures = get_measure_columns(comparison_df)
+    new_columns = {}
+    failure = np.zeros(len(comparison_df), dtype=bool)
+
+    for col in measures:
+        source = comparison_df[f'{col}_source']
+        target = comparison_df[f'{col}_target']
+        source_missing = source.isna().to_numpy()
+        target_missing = target.isna().to_numpy()
+
+        variance = source.sub(target, fill_value=0)
+        both_present = ~source_missing & ~target_missing
+        equal = (source == target).to_numpy()
+        if tolerance:
+            within = both_present & (variance.abs() <= tolerance).to_numpy()
+            variance = variance.mask(within, 0.0)
+            equal = equal | within
+
+        notes = np.select(
+            [equal, both_present, target_missing],
+            [NOTE_MATCH, NOTE_MISMATCH, NOTE_SOURCE_ONLY],
+            default=NOTE_TARGET_ONLY)
+
+        new_columns[f'{col}_variance'] = variance
+        new_columns[f'{col}_notes'] = pd.Series(notes, index=comparison_df.index)
+        # NaN variances (value missing on both sides) count as failures, as before
+        failure |= (variance != 0).to_numpy()
+
+        if 'rowfailure' not in new_columns:
+            # Keep the historical layout: rowfailure follows the first measure's notes
+            new_columns['rowfailure'] = None
+
+    if 'rowfailure' in new_columns:
+        new_columns['rowfailure'] = pd.Series(np.where(failure, 'fail', 'success'), index=comparison_df.index)
+
+    return pd.concat([comparison_df, pd.DataFrame(new_columns, index=comparison_df.index)], axis=1)
+
+
+def encode_dimensions(df_source, df_target, row_dimensions):
+    """
+    Dictionary-encode the row dimensions of both frames against one shared vocabulary
+    per dimension, sorted so that code order is member order. A missing member gets
+    the highest code, so it sorts last as in a join on the members themselves.
+
+    Returns the integer join keys of each side and the vocabularies. The codes of all
+    dimensions are packed into a single int64 key when their ranges fit, otherwise the
+    key is a MultiIndex of the per-dimension codes.
+    """
+    source_codes, target_codes, vocabularies = [], [], []
+    for dimension in row_dimensions:
+        members = union_categoricals([pd.Categorical(df_source[dimension]), pd.Categorical(df_target[dimension])],
+                                     sort_categories=True, ignore_order=True)
+        codes = members.codes.astype(np.int64)
+        codes[codes == -1] = len(members.categories)
+        source_codes.append(codes[:len(df_source)])
+        target_codes.append(codes[len(df_source):])
+        vocabularies.append(members.categories)
+
+    sizes = [len(vocabulary) + 1 for vocabulary in vocabularies]
+    if np.prod([float(size) for size in sizes]) < 2 ** 63:
+        strides = np.cumprod([1] + sizes[:0:-1])[::-1].astype(np.int64)
+        return (pd.Index(sum(c * stride for c, stride in zip(source_codes, strides)), dtype=np.int64),
+                pd.Index(sum(c * stride for c, stride in zip(target_codes, strides)), dtype=np.int64),
+                vocabularies)
+    return pd.MultiIndex.from_arrays(source_codes), pd.MultiIndex.from_arrays(target_codes), vocabularies
+
+
+def decode_dimensions(keys, row_dimensions, vocabularies):
+    """
+    Categorical row-dimension columns for join keys built by encode_dimensions.
+    """
+    if isinstance(keys, pd.MultiIndex):
+        codes = [keys.get_level_values(i).to_numpy() for i in range(len(row_dimensions))]
+    else:
+        sizes = [len(vocabulary) + 1 for vocabulary in vocabularies]
+        strides = np.cumprod([1] + sizes[:0:-1])[::-1].astype(np.int64)
+        values = keys.to_numpy()
+        codes = [values // stride % size for stride, size in zip(strides, sizes)]
+    return {dimension: pd.Categorical.from_codes(np.where(code == len(vocabulary), -1, code), vocabulary)
+            for dimension, code, vocabulary in zip(row_dimensions, codes, vocabularies)}
+
+
+def compare_frames(df_source, df_target, row_dimensions, tolerance=0.0, timings=None):
+    """
+    Outer join source and target on the row dimensions and add the variance, notes
+    and rowfailure columns. Returns the joined frame with the row dimensions as columns.
+
+    The join runs on integer keys from encode_dimensions; the members are decoded back
+    into categorical columns only once the variances have been computed.
+    """
+    with span('join', timings) as record:
+        source_keys, target_keys, vocabularies = encode_dimensions(df_source, df_target, row_dimensions)
+        source = df_source.drop(columns=row_dimensions).set_axis(source_keys)
+        target = df_target.drop(columns=row_dimensions).set_axis(target_keys)
+        comparison_df = source.join(target, how='outer', lsuffix='_source', rsuffix='_target', sort=True)
+        record['rows'] = len(comparison_df)
+
+    with span('variance', timings, rows=len(comparison_df)):
+        comparison_df = compute_variances(comparison_df, tolerance)
+
+    dimensions = pd.DataFrame(decode_dimensions(comparison_df.index, row_dimensions, vocabularies))
+    return pd.concat([dimensions, comparison_df.reset_index(drop=True)], axis=1)
+
+
+NOTES = np.array([NOTE_MATCH, NOTE_MISMATCH, NOTE_SOURCE_ONLY, NOTE_TARGET_ONLY], dtype=object)
+MATCH, MISMATCH, SOURCE_ONLY, TARGET_ONLY = range(4)
+
+
+def to_long(df, row_ids, measures):
+    """
+    Sparse long layout of a wide frame: one (row, member, value) record per non-missing
+    cell, where `row` is the row's id in `row_ids` and `member` the measure's position.
+    """
+    values = df[measures].to_numpy(dtype=np.float64)
+    rows, members = np.nonzero(~np.isnan(values))
+    return pd.DataFrame({'row': row_ids[rows], 'member': members, 'value': values[rows, members]})
+
+
+def compare_long(source_long, target_long, measure_count, tolerance=0.0):
+    """
+    Outer join two long frames on (row, member) and add the variance and note code of
+    each cell present on either side, with the same rules as compute_variances.
+    """
+    source_cells = source_long['row'].to_numpy() * measure_count + source_long['member'].to_numpy()
+    target_cells = target_long['row'].to_numpy() * measure_count + target_long['member'].to_numpy()
+    # Outer join on the cell ids: every id present on either side, in cell order
+    cell_ids, positions = np.unique(np.concatenate([source_cells, target_cells]), return_inverse=True)
+    source = np.full(len(cell_ids), np.nan)
+    target = np.full(len(cell_ids), np.nan)
+    source[positions[:len(source_cells)]] = source_long['value'].to_numpy()
+    target[positions[len(source_cells):]] = target_long['value'].to_numpy()
+    source_missing, target_missing = np.isnan(source), np.isnan(target)
+    both_present = ~source_missing & ~target_missing
+
+    variance = np.where(source_missing, 0.0, source) - np.where(target_missing, 0.0, target)
+    equal = source == target
+    if tolerance:
+        within = both_present & (np.abs(variance) <= tolerance)
+        variance[within] = 0.0
+        equal |= within
+
+    return pd.DataFrame({
+        'row': cell_ids // measure_count,
+        'member': cell_ids % measure_count,
+        'source': source,
+        'target': target,
+        'variance': variance,
+        'note': np.select([equal, both_present, target_missing], [MATCH, MISMATCH, SOURCE_ONLY],
+                          default=TARGET_ONLY).astype(np.int8),
+    })
+
+
+def pivot_wide(cells, row_count, measures):
+    """
+    Scatter compared long cells back into the wide layout compute_variances produces.
+    Cells missing on both sides get a missing variance and the source-only note, as
+    in the wide comparison.
+    """
+    shape = (row_count, len(measures))
+    wide = {name: np.full(shape, np.nan) for name in ('source', 'target', 'variance')}
+    notes = np.full(shape, SOURCE_ONLY, dtype=np.int8)
+    rows, members = cells['row'].to_numpy(), cells['member'].to_numpy()
+    for name in wide:
+        wide[name][rows, members] = cells[name].to_numpy()
+    notes[rows, members] = cells['note'].to_numpy()
+    failure = (wide['variance'] != 0).any(axis=1)
+
+    columns = {}
+    for side in ('source', 'target'):
+        for i, col in enumerate(measures):
+            columns[f'{col}_{side}'] = wide[side][:, i]
+    for i, col in enumerate(measures):
+        columns[f'{col}_variance'] = wide['variance'][:, i]
+        columns[f'{col}_notes'] = NOTES[notes[:, i]]
+        if i == 0:
+            columns['rowfailure'] = np.where(failure, 'fail', 'success')
+    return pd.DataFrame(columns)
+
+
+def compare_frames_long(df_source, df_target, row_dimensions, tolerance=0.0, timings=None):
+    """
+    compare_frames on a sparse long model: both sides are reduced to their non-missing
+    cells, joined and given variances cell by cell, and only pivoted back to the wide
+    layout for output. Produces the same frame as compare_frames.
+
+    Falls back to compare_frames when the sides have different or non-float measure
+    columns, or repeat an intersection, which the long model does not represent.
+    """
+    measures = [c for c in df_source.columns if c not in row_dimensions]
+    target_measures = [c for c in df_target.columns if c not in row_dimensions]
+    source_keys, target_keys, vocabularies = encode_dimensions(df_source, df_target, row_dimensions)
+    if (measures != target_measures or not source_keys.is_unique or not target_keys.is_unique
+            or not all(pd.api.types.is_float_dtype(df[c]) for df in (df_source, df_target) for c in measures)):
+        logging.info("Long comparison not applicable to these extracts, comparing in the wide layout")
+        return compare_frames(df_source, df_target, row_dimensions, tolerance, timings)
+
+    with span('join', timings, layout='long') as record:
+        ids, row_keys = pd.factorize(source_keys.append(target_keys), sort=True)
+        source_long = to_long(df_source, ids[:len(df_source)], measures)
+        target_long = to_long(df_target, ids[len(df_source):], measures)
+        record['cells'] = len(source_long) + len(target_long)
+
+    with span('variance', timings, layout='long') as record:
+        cells = compare_long(source_long, target_long, len(measures), tolerance)
+        record['cells'] = len(cells)
+
+    with span('pivot', timings, rows=len(row_keys)):
+        dimensions = pd.DataFrame(decode_dimensions(row_keys, row_dimensions, vocabularies))
+        comparison_df = pd.concat([dimensions, pivot_wide(cells, len(row_keys), measures)], axis=1)
+    return comparison_df
+
+
+def summarize_variances(comparison_df, row_dimensions):
+    """
+    One row per member of each row dimension: how many intersections were compared and
+    failed, and the total and absolute total of their variances.
+    """
+    variances = comparison_df[[c for c in comparison_df.columns if c.endswith('_variance')]].to_numpy(dtype=np.float64)
+    per_row = pd.DataFrame({
+        'Rows': 1,
+        'Failures': (comparison_df['rowfailure'] == 'fail').to_numpy(dtype=np.int64)
+        if 'rowfailure' in comparison_df.columns else 0,
+        'Variance': np.nansum(variances, axis=1),
+        'AbsoluteVariance': np.nansum(np.abs(variances), axis=1),
+    }, index=comparison_df.index)
+
+    summaries = []
+    for dimension in row_dimensions:
+        summary = per_row.groupby(comparison_df[dimension].astype(str).to_numpy()).sum()
+        summaries.append(summary.rename_axis('Member').reset_index().assign(Dimension=dimension))
+    columns = ['Dimension', 'Member', 'Rows', 'Failures', 'Variance', 'AbsoluteVariance']
+    if not summaries:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(summaries, ignore_index=True)[columns]
+
+
+def select_exceptions(df_source, df_target, comparison_df, row_dimensions):
+    """
+    Keep only the failing rows of a comparison, and the source and target rows of
+    those intersections.
+    """
+    if 'rowfailure' not in comparison_df.columns:
+        return df_source.iloc[:0], df_target.iloc[:0], comparison_df.iloc[:0]
+    failures = comparison_df[comparison_df['rowfailure'] == 'fail'].reset_index(drop=True)
+    failing_keys = key_hashes(failures, row_dimensions)
+    return (df_source[np.isin(key_hashes(df_source, row_dimensions), failing_keys)].reset_index(drop=True),
+            df_target[np.isin(key_hashes(df_target, row_dimensions), failing_keys)].reset_index(drop=True),
+            failures)
+
+
+def partition_ids(df, dimension, partitions):
+    """
+    Partition number of each row, from a hash of its `dimension` member.
+    """
+    hashes = pd.util.hash_pandas_object(df[dimension].astype(str), index=False).to_numpy()
+    return hashes % np.uint64(partitions)
+
+
+def compare_frames_parallel(df_source, df_target, row_dimensions, tolerance=0.0, workers=2, compare=None):
+    """
+    compare_frames spread over `workers` processes.
+
+    Both frames are partitioned by a hash of the first row dimension, so every
+    intersection lands in the same partition on both sides. The partitions are
+    compared in a process pool and concatenated back into the order the
+    single-process join produces (sorted by the row dimensions). `compare` is the
+    function run on each partition, compare_frames by default.
+    """
+    compare = compare or compare_frames
+    source_ids = partition_ids(df_source, row_dimensions[0], workers)
+    target_ids = partition_ids(df_target, row_dimensions[0], workers)
+    partitions = [p for p in range(workers) if (source_ids == p).any() or (target_ids == p).any()]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(compare,
+                                    [df_source[source_ids == p] for p in partitions],
+                                    [df_target[target_ids == p] for p in partitions],
+                                    [row_dimensions] * len(partitions),
+                                    [tolerance] * len(partitions)))
+
+    if not results:
+        return compare(df_source, df_target, row_dimensions, tolerance)
+    comparison_df = pd.concat(results, ignore_index=True)
+    return comparison_df.sort_values(row_dimensions, kind='stable', ignore_index=True)
+
+
+def normalize_for_hash(df, row_dimensions):
+    """
+    Row dimensions first (as strings), then measures sorted by name, with numeric
+    measures as float64, so equal content hashes equally however it was parsed.
+    """
+    measures = sorted(c for c in df.columns if c not in row_dimensions)
+    normalized = df[list(row_dimensions) + measures].copy()
+    for col in measures:
+        if pd.api.types.is_numeric_dtype(normalized[col]):
+            normalized[col] = normalized[col].astype('float64')
+    for col in row_dimensions:
+        normalized[col] = normalized[col].astype(str)
+    return normalized
+
+
+def row_hashes(df, row_dimensions):
+    """
+    64-bit hash of each normalised row, dimensions and values included.
+    """
+    return pd.util.hash_pandas_object(normalize_for_hash(df, row_dimensions), index=False).to_numpy()
+
+
+def key_hashes(df, row_dimensions):
+    """
+    64-bit hash of each row's row-dimension tuple, identifying the intersection.
+    """
+    return pd.util.hash_pandas_object(df[list(row_dimensions)].astype(str), index=False).to_numpy()
+
+
+def content_hash(df, row_dimensions):
+    """
+    Return an order-independent digest of a frame's contents.
+
+    Each normalised row is hashed and the row hashes are combined with wrapping sum
+    and xor, so two extracts with the same rows in a different order match.
+    """
+    hashes = row_hashes(df, row_dimensions)
+    columns = [str(c) for c in row_dimensions] + sorted(str(c) for c in df.columns if c not in row_dimensions)
+    digest = hashlib.sha256()
+    digest.update('\x1f'.join(columns).encode())
+    digest.update(np.array([len(hashes),
+                            np.add.reduce(hashes, dtype=np.uint64),
+                            np.bitwise_xor.reduce(hashes) if len(hashes) else 0],
+                           dtype=np.uint64).tobytes())
+    return digest.hexdigest()
+
+
+def group_checksums(ids, hashes, group_count):
+    """
+    Per-group wrapping sum and xor of the row hashes of the rows labelled `ids`.
+    """
+    checksum_sum = np.zeros(group_count, dtype=np.uint64)
+    checksum_xor = np.zeros(group_count, dtype=np.uint64)
+    np.add.at(checksum_sum, ids, hashes)
+    np.bitwise_xor.at(checksum_xor, ids, hashes)
+    return checksum_sum, checksum_xor
+
+
+def prune_matching_groups(df_source, df_target, row_dimensions, rollup_depth=1):
+    """
+    Rollup-first pass of a comparison, drilling down one row dimension at a time.
+
+    At level 1 both sides are aggregated by the first row dimension, and each group's
+    row count, measure total and row-hash checksum (as in content_hash) are compared.
+    Groups that match are pruned; only the rows of the others are regrouped at level 2
+    by the first two row dimensions, and so on down to level `rollup_depth`. The rows
+    of the groups still differing there are returned for the detailed comparison,
+    together with a frame listing every group examined, its level, row counts and
+    measure totals, and whether it was pruned as matching, expanded to the next level
+    or compared.
+    """
+    rollup_depth = max(1, min(rollup_depth, len(row_dimensions)))
+    same_columns = set(df_source.columns) == set(df_target.columns)
+    sides = []
+    for df in (df_source, df_target):
+        measures = df.drop(columns=list(row_dimensions)).apply(pd.to_numeric, errors='coerce')
+        sides.append({'hashes': row_hashes(df, row_dimensions),
+                      'totals': np.nansum(measures.to_numpy(dtype=np.float64), axis=1),
+                      'keep': np.ones(len(df), dtype=bool)})
+
+    levels = []
+    for level in range(1, rollup_depth + 1):
+        group_dimensions = list(row_dimensions[:level])
+        source_keys, target_keys, vocabularies = encode_dimensions(df_source.loc[sides[0]['keep'], group_dimensions],
+                                                                   df_target.loc[sides[1]['keep'], group_dimensions],
+                                                                   group_dimensions)
+        ids, group_keys = pd.factorize(source_keys.append(target_keys), sort=True)
+        side_ids = (ids[:len(source_keys)], ids[len(source_keys):])
+        group_count = len(group_keys)
+
+        groups = {dimension: np.asarray(members, dtype=object) for dimension, members in
+                  decode_dimensions(group_keys, group_dimensions, vocabularies).items()}
+        groups['level'] = np.full(group_count, level)
+        checksums = []
+        for name, side, ids in zip(('source', 'target'), sides, side_ids):
+            groups[f'{name}_rows'] = np.bincount(ids, minlength=group_count)
+            groups[f'{name}_total'] = np.bincount(ids, weights=side['totals'][side['keep']], minlength=group_count)
+            checksums.append(group_checksums(ids, side['hashes'][side['keep']], group_count))
+
+        matching = ((groups['source_rows'] == groups['target_rows'])
+                    & np.isclose(groups['source_total'], groups['target_total'])
+                    & (checksums[0][0] == checksums[1][0]) & (checksums[0][1] == checksums[1][1]))
+        if not same_columns:
+            matching[:] = False
+        groups['status'] = np.where(matching, 'pruned', 'compared' if level == rollup_depth else 'expanded')
+        levels.append(pd.DataFrame(groups))
+
+        logging.info(f"Rollup by {', '.join(group_dimensions)}: {int(matching.sum())} of {group_count} groups match, "
+                     f"{'comparing' if level == rollup_depth else 'expanding'} {int((~matching).sum())}")
+        for side, ids in zip(sides, side_ids):
+            side['keep'][side['keep']] = ~matching[ids]
+        if matching.all():
+            break
+
+    return (df_source[sides[0]['keep']].reset_index(drop=True),
+            df_target[sides[1]['keep']].reset_index(drop=True),
+            pd.concat(levels, ignore_index=True).reindex(
+                columns=list(row_dimensions[:rollup_depth]) + list(levels[0].columns[1:])))
@@ -0,0 +1,161 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+
+from app.core.instrumentation import collect_observations, stage_metrics
+from app.core.job_tracker import JobRegistry
+from app.core.logging_engine import *
+from app.core.xlsx_functions import save_to_excel_with_hash_check
+
+DEFAULT_COMPARISON_WORKERS = 2
+# Seconds a finished job's directory (and the workbook in it) is kept for download
+DEFAULT_JOB_RETENTION = 3600
+
+
+def run_comparison_job(job_id, progress, comparison_args):
+    """
+    Worker-process entry point: run one comparison, reporting each stage it starts
+    in the shared `progress` dict under `job_id`. Returns the status code and the
+    observations of the comparison's spans, as the worker's own `stage_metrics` are
+    never scraped.
+    """
+    def report(stage):
+        progress[job_id] = stage
+
+    with collect_observations() as observations:
+        status_code = save_to_excel_with_hash_check(**comparison_args, progress=report)
+    return status_code, observations
+
+
+class ComparisonJobQueue:
+    """
+    Runs workbook comparisons in a process pool so the parsing, joining and writing
+    never hold the server's event loop or GIL.
+
+    Uploaded inputs are copied to a per-job directory on disk before the job is
+    queued, and removed once it finishes. The directory itself, with any workbook
+    written to it, is removed `retention` seconds after the job finished. Job states
+    are kept in a JobRegistry; the stage a running job has reached is shared back
+    from the worker processes.
+    """
+
+    def __init__(self, max_workers=DEFAULT_COMPARISON_WORKERS, retention=DEFAULT_JOB_RETENTION):
+        self.max_workers = max_workers
+        self.retention = retention
+        self.registry = JobRegistry()
+        self._executor = None
+        self._manager = None
+        self._progress = None
+        self._job_dirs = {}
+        # submit() runs in worker threads, so the pool must only be started once
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._executor is None:
+                self._manager = multiprocessing.Manager()
+                self._progress = self._manager.dict()
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+
+    def submit(self, source_file, target_file, excel_path=None, **comparison_args):
+        """
+        Queue a comparison of two readable binary streams and return its job record.
+        The workbook is written to `excel_path`, or to the job directory if omitted.
+        """
+        self._ensure_started()
+        self.sweep()
+        job_id = uuid.uuid4().hex
+        job_dir = tempfile.mkdtemp(prefix=f"comparison_{job_id}_")
+        with self._lock:
+            self._job_dirs[job_id] = job_dir
+        inputs = []
+        for name, stream in (('source.csv', source_file), ('target.csv', target_file)):
+            path = os.path.join(job_dir, name)
+            with open(path, 'wb') as copy:
+                shutil.copyfileobj(stream, copy)
+            inputs.append(path)
+
+        excel_path = excel_path or os.path.join(job_dir, 'comparison.xlsx')
+        record = {"jobId": job_id, "state": "queued", "excelPath": excel_path, "submittedAt": time.time()}
+        self.registry.save(record)
+
+        future = self._executor.submit(run_comparison_job, job_id, self._progress,
+                                       dict(comparison_args, data_pull_csv=inputs[0], comparison_csv=inputs[1],
+                                            excel_path=excel_path))
+        future.add_done_callback(lambda done: self._finish(job_id, job_dir, inputs, done))
+        return record
+
+    def get(self, job_id):
+        """
+        Current record of a job, including the stage it has reached while running.
+        """
+        record = self.registry.get(job_id)
+        if record is None:
+            return None
+        record = dict(record)
+        # The shared progress dict is gone once the queue has been shut down
+        progress = self._progress
+        if record["state"] == "queued" and progress is not None and job_id in progress:
+            record["state"] = "running"
+            record["stage"] = progress.get(job_id)
+        return record
+
+    def _finish(self, job_id, job_dir, inputs, future):
+        record = dict(self.registry.get(job_id))
+        try:
+            status_code, observations = future.result()
+            timings = {}
+            for stage, seconds, rows, failed in observations:
+                stage_metrics.observe(stage, seconds, rows, failed)
+                timings[stage] = timings.get(stage, 0.0) + seconds
+            record.update(state="completed", statusCode=status_code,
+                          timings={stage: round(seconds, 4) for stage, seconds in timings.items()})
+        except CancelledError:
+            # Queued jobs are cancelled when the queue shuts down
+            record.update(state="cancelled")
+        except Exception as e:
+            logging.error(f"Comparison job {job_id} failed: {e}")
+            record.update(state="failed", detail=str(e))
+        record["finishedAt"] = time.time()
+        self.registry.save(record)
+        if self._progress is not None:
+            self._progress.pop(job_id, None)
+        for path in inputs:
+            # shutdown() may already have removed the job directory
+            if os.path.exists(path):
+                os.remove(path)
+
+    def sweep(self):
+        """
+        Remove the directories of jobs that finished more than `retention` seconds ago
+        and mark those jobs as expired.
+        """
+        cutoff = time.time() - self.retention
+        with self._lock:
+            expired = [job_id for job_id in self._job_dirs
+                       if self.registry.get(job_id).get("finishedAt", float('inf')) < cutoff]
+            job_dirs = [self._job_dirs.pop(job_id) for job_id in expired]
+        for job_id, job_dir in zip(expired, job_dirs):
+            shutil.rmtree(job_dir, ignore_errors=True)
+            record = self.registry.get(job_id)
+            if os.path.dirname(record["excelPath"]) == job_dir:
+                self.registry.save(dict(record, state="expired"))
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._manager.shutdown()
+                self._executor = self._manager = self._progress = None
+            job_dirs, self._job_dirs = list(self._job_dirs.values()), {}
+        for job_dir in job_dirs:
+            shutil.rmtree(job_dir, ignore_errors=True)
+
+
+comparison_jobs = ComparisonJobQueue(int(os.environ.get("COMPARISON_WORKERS", DEFAULT_COMPARISON_WORKERS)),
+                                     float(os.environ.get("COMPARISON_JOB_RETENTION", DEFAULT_JOB_RETENTION)))
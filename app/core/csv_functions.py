@@ -1,10 +1,10 @@
 import csv
-import io
 
 import numpy as np
 import pandas as pd
 from starlette.responses import JSONResponse
 
+from app.core.input_functions import open_csv_input, read_csv_header_lines
 from app.core.logging_engine import *
 
 
@@ -15,35 +15,26 @@ def csv_to_export_json(
         col_dimensions: str,
         row_dimensions: str):
 
-    # Read the uploaded CSV file into a DataFrame
-    content = file.read()
-    csv_content = io.StringIO(content.decode())
-    df = pd.read_csv(csv_content, header=None)
-
-    # Replace NaNs and Infs
-    df.replace([np.inf, -np.inf], np.nan, inplace=True)
-    df.fillna("", inplace=True)
-
     pov_dimensions_list = pov_dimensions.split(", ")
     pov_dimension_members_list = pov_dimension_members.split(", ")
     col_dimensions_list = col_dimensions.split(", ")
     row_dimensions_list = row_dimensions.split(", ")
 
-    # Read column members
-    col_members = []
-    for col_index in range(len(row_dimensions_list), df.shape[1]):
-        members_for_col = []
-        for row_index in range(len(col_dimensions_list)):
-            members_for_col.append([df.iloc[row_index, col_index]])
-        col_members.append({"dimensions": col_dimensions_list, "members": members_for_col})
+    with open_csv_input(file) as csv_file:
+        # Only the column header block and the row member cells are needed, so the
+        # data body is never parsed
+        header_lines = read_csv_header_lines(csv_file, len(col_dimensions_list))
+        header_block = np.array(list(csv.reader(header_lines)), dtype=object)
+        row_block = pd.read_csv(csv_file, header=None, usecols=range(len(row_dimensions_list)), dtype=str,
+                                keep_default_na=False).to_numpy()
+
+    # Read column members, one column of the header block per grid column
+    col_members = [{"dimensions": col_dimensions_list, "members": [[m] for m in members]}
+                   for members in header_block[:, len(row_dimensions_list):].T.tolist()]
 
     # Read row members
-    row_members = []
-    for row_index in range(len(col_dimensions_list), df.shape[0]):
-        members_for_row = []
-        for col_index in range(len(row_dimensions_list)):
-            members_for_row.append([df.iloc[row_index, col_index]])
-        row_members.append({"dimensions": row_dimensions_list, "members": members_for_row})
+    row_members = [{"dimensions": row_dimensions_list, "members": [[m] for m in members]}
+                   for members in row_block.tolist()]
 
     # Prepare the payload
     payload = {
@@ -0,0 +1,143 @@
+import asyncio
+import weakref
+from urllib.parse import urlsplit
+
+import httpx
+
+from app.core.instrumentation import span
+from app.core.logging_engine import *
+
+DEFAULT_MAX_CONNECTIONS = 100
+DEFAULT_MAX_CONNECTIONS_PER_HOST = 10
+DEFAULT_TIMEOUT = 300.0
+DEFAULT_CONNECT_TIMEOUT = 10.0
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR = 0.5
+
+# Responses worth retrying: throttling and transient gateway errors
+RETRY_STATUS_CODES = {429, 502, 503, 504}
+# Methods retried by default; a retried POST may repeat work EPM already accepted
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+
+class EpmClient:
+    """
+    Async HTTP client for the EPM REST API.
+
+    Wraps one httpx.AsyncClient so connections are kept alive and pooled across
+    calls, caps the number of concurrent requests per host, and retries transport
+    errors and throttled/unavailable responses of idempotent requests with
+    exponential backoff. A
+    `transport` (e.g. an httpx.MockTransport) replaces the network connection.
+    """
+
+    def __init__(self,
+                 max_connections=DEFAULT_MAX_CONNECTIONS,
+                 max_connections_per_host=DEFAULT_MAX_CONNECTIONS_PER_HOST,
+                 timeout=DEFAULT_TIMEOUT,
+                 max_retries=DEFAULT_MAX_RETRIES,
+                 backoff_factor=DEFAULT_BACKOFF_FACTOR,
+                 transport=None):
+        self.max_connections_per_host = max_connections_per_host
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self._host_semaphores = {}
+        self._client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(timeout, connect=DEFAULT_CONNECT_TIMEOUT),
+            transport=transport)
+
+    @property
+    def is_closed(self):
+        return self._client.is_closed
+
+    def _host_semaphore(self, url):
+        host = urlsplit(url).netloc
+        if host not in self._host_semaphores:
+            self._host_semaphores[host] = asyncio.Semaphore(self.max_connections_per_host)
+        return self._host_semaphores[host]
+
+    async def request(self, method, url, auth=None, retry=None, **kwargs):
+        """
+        Send a request, retrying up to max_retries times. The last response is
+        returned as-is once retries are exhausted; the last transport error is raised.
+        The call, retries included, is instrumented as one 'epm_http' span.
+
+        `retry` defaults to True for idempotent methods only. Requests that were not
+        retried are still resent once more if the connection could not be opened,
+        since EPM never received them.
+        """
+        if retry is None:
+            retry = method.upper() in IDEMPOTENT_METHODS
+        with span('epm_http', method=method, path=urlsplit(url).path) as record:
+            attempt = 0
+            while True:
+                record['attempts'] = attempt + 1
+                try:
+                    async with self._host_semaphore(url):
+                        response = await self._client.request(method, url, auth=auth, **kwargs)
+                    record['status'] = response.status_code
+                    if not retry or response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                        return response
+                    logging.warning(f"{method} {url} returned {response.status_code}, retrying")
+                except httpx.TransportError as e:
+                    if attempt >= self.max_retries or not (retry or isinstance(e, httpx.ConnectError)):
+                        raise
+                    logging.warning(f"{method} {url} failed with {e!r}, retrying")
+                await asyncio.sleep(self.backoff_factor * 2 ** attempt)
+                attempt += 1
+
+    async def get(self, url, auth=None, **kwargs):
+        return await self.request("GET", url, auth=auth, **kwargs)
+
+    async def post(self, url, auth=None, **kwargs):
+        return await self.request("POST", url, auth=auth, **kwargs)
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+
+# httpx clients are bound to the event loop they first run on, so share one per loop
+_shared_clients = weakref.WeakKeyDictionary()
+
+
+def get_epm_client():
+    """
+    Return the EpmClient shared by all EPM calls on the running event loop.
+    """
+    loop = asyncio.get_running_loop()
+    client = _shared_clients.get(loop)
+    if client is None or client.is_closed:
+        client = EpmClient()
+        _shared_clients[loop] = client
+    return client
+
+
+async def close_epm_client():
+    """
+    Close the shared client of the running event loop, if one was created.
+    """
+    client = _shared_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def run_with_epm_client(coroutine):
+    """
+    Run an EPM coroutine to completion from synchronous code (e.g. the CLI) and close
+    the shared client it used before the event loop goes away.
+    """
+    async def run_and_close():
+        try:
+            return await coroutine
+        finally:
+            await close_epm_client()
+
+    return asyncio.run(run_and_close())
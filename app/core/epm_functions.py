@@ -1,22 +1,228 @@
+import asyncio
+import copy
 import csv
 import io
+import itertools
 import json
-import time
+import math
 
-from fastapi import requests, HTTPException
-from starlette.background import BackgroundTasks
+import httpx
+from starlette.exceptions import HTTPException
 
+from app.core.epm_client import get_epm_client
+from app.core.export_cache import export_cache, export_cache_key
+from app.core.job_tracker import DEFAULT_MAX_POLLS, DEFAULT_POLL_INTERVAL, job_tracker
 from app.core.logging_engine import *
 
 
-def export_data_slice_json(
+DEFAULT_SLICE_WORKERS = 4
+
+
+def count_segment_cells(segment):
+    """
+    Number of member combinations in a rows/columns segment of a gridDefinition.
+    Member functions such as ILvl0Descendants() count as a single member.
+    """
+    return math.prod(len(members) for members in segment["members"])
+
+
+def count_grid_cells(grid_definition):
+    """
+    Number of data cells a gridDefinition exports.
+    """
+    rows = sum(count_segment_cells(segment) for segment in grid_definition.get("rows", []))
+    columns = sum(count_segment_cells(segment) for segment in grid_definition.get("columns", []))
+    return rows * columns
+
+
+def split_row_segment(segment, dimension, max_rows):
+    """
+    Split a row segment along `dimension` so each piece has at most `max_rows` rows
+    (or a single member of `dimension` if that is still too many).
+    """
+    if dimension not in segment["dimensions"] or count_segment_cells(segment) <= max_rows:
+        return [segment]
+
+    position = segment["dimensions"].index(dimension)
+    members = segment["members"][position]
+    rows_per_member = count_segment_cells(segment) // len(members)
+    members_per_piece = max(1, max_rows // rows_per_member)
+
+    pieces = []
+    for start in range(0, len(members), members_per_piece):
+        piece = copy.deepcopy(segment)
+        piece["members"][position] = members[start:start + members_per_piece]
+        pieces.append(piece)
+    return pieces
+
+
+def plan_export_slices(grid_definition, max_cells, split_dimension=None):
+    """
+    Split a gridDefinition into sub-grids of at most `max_cells` cells.
+
+    When `split_dimension` is a POV dimension with several members, one sub-grid is
+    planned per member. Rows are then split along `split_dimension` (or the first row
+    dimension) and packed greedily into sub-grids under the budget. Returns a list of
+    (pov_member, grid_definition) pairs, where pov_member is None unless the POV was split.
+    """
+    pov = grid_definition.get("pov", {"dimensions": [], "members": []})
+    if count_grid_cells(grid_definition) <= max_cells and split_dimension not in pov["dimensions"]:
+        return [(None, grid_definition)]
+
+    pov_grids = [(None, grid_definition)]
+    if split_dimension in pov["dimensions"]:
+        position = pov["dimensions"].index(split_dimension)
+        pov_grids = []
+        for member in pov["members"][position]:
+            pov_grid = copy.deepcopy(grid_definition)
+            pov_grid["pov"]["members"][position] = [member]
+            pov_grids.append((member, pov_grid))
+
+    rows = grid_definition.get("rows", [])
+    row_dimension = split_dimension
+    if rows and split_dimension not in rows[0]["dimensions"]:
+        row_dimension = rows[0]["dimensions"][0]
+
+    columns = sum(count_segment_cells(segment) for segment in grid_definition.get("columns", []))
+    max_rows = max(1, max_cells // max(1, columns))
+
+    slices = []
+    for pov_member, pov_grid in pov_grids:
+        pieces = [piece for segment in pov_grid.get("rows", [])
+                  for piece in split_row_segment(segment, row_dimension, max_rows)]
+
+        # Pack consecutive pieces into sub-grids while they fit in the budget
+        batch, batch_rows = [], 0
+        for piece in pieces + [None]:
+            piece_rows = count_segment_cells(piece) if piece else 0
+            if batch and (piece is None or batch_rows + piece_rows > max_rows):
+                sub_grid = copy.deepcopy(pov_grid)
+                sub_grid["rows"] = batch
+                slices.append((pov_member, sub_grid))
+                batch, batch_rows = [], 0
+            if piece:
+                batch.append(piece)
+                batch_rows += piece_rows
+        if not pieces:
+            slices.append((pov_member, pov_grid))
+    return slices
+
+
+def order_column_keys(results, grid_definition=None):
+    """
+    Column header tuples of all sub-slice responses, in the order a single export of
+    `grid_definition` would return them.
+
+    Keys are ordered by the member order of the request's `columns` segments. When a
+    response has keys the request does not list, e.g. because a member function such
+    as ILvl0Descendants() was expanded, each new key is placed after the key that
+    precedes it in the response that returned it instead.
+    """
+    column_keys = []
+    for _, data in results:
+        position = 0
+        for key in zip(*data.get("columns", [])):
+            if key in column_keys:
+                position = column_keys.index(key) + 1
+            else:
+                column_keys.insert(position, key)
+                position += 1
+
+    requested = {}
+    for segment in (grid_definition or {}).get("columns", []):
+        for key in itertools.product(*segment["members"]):
+            requested.setdefault(key, len(requested))
+    if all(key in requested for key in column_keys):
+        column_keys.sort(key=requested.get)
+    return column_keys
+
+
+def merge_export_slices(results, grid_definition=None, split_dimension=None):
+    """
+    Merge exportdataslice responses for the sub-slices of `grid_definition` back into
+    one grid.
+
+    Columns are aligned by their header tuples (see order_column_keys), filling cells a
+    sub-slice did not return with "#Missing", as a single export would. When the POV
+    was split on `split_dimension`, the POV member is prepended to each row's headers
+    so the rows remain distinguishable, and that dimension is dropped from the merged
+    POV, which would otherwise only name the first sub-slice's member.
+    """
+    if not results:
+        return {"columns": [], "rows": []}
+
+    column_keys = order_column_keys(results, grid_definition)
+    column_depth = len(column_keys[0]) if column_keys else 0
+
+    merged = {key: value for key, value in results[0][1].items() if key not in ("columns", "rows")}
+    pov_dimensions = (grid_definition or {}).get("pov", {}).get("dimensions", [])
+    if results[0][0] is not None and split_dimension in pov_dimensions and \
+            len(merged.get("pov", [])) == len(pov_dimensions):
+        merged["pov"] = [member for dimension, member in zip(pov_dimensions, merged["pov"])
+                         if dimension != split_dimension]
+    merged["columns"] = [[key[level] for key in column_keys] for level in range(column_depth)]
+    merged["rows"] = []
+    for pov_member, data in results:
+        slice_keys = list(zip(*data.get("columns", [])))
+        aligned = slice_keys == column_keys
+        positions = {key: i for i, key in enumerate(slice_keys)}
+        for row in data.get("rows", []):
+            headers = row.get("headers", [])
+            if pov_member is not None:
+                headers = [pov_member] + headers
+            values = row.get("data", [])
+            if not aligned:
+                values = [values[positions[key]] if key in positions else "#Missing" for key in column_keys]
+            merged["rows"].append({**row, "headers": headers, "data": values})
+    return merged
+
+
+async def export_slices_concurrently(url, username, password, payload_dict, slices,
+                                     max_workers=DEFAULT_SLICE_WORKERS, split_dimension=None):
+    """
+    Post each planned sub-slice to `url` with at most `max_workers` requests in flight
+    over the shared EPM client, then merge the responses in plan order.
+    """
+    client = get_epm_client()
+    semaphore = asyncio.Semaphore(max_workers)
+
+    async def export_slice(planned):
+        pov_member, grid_definition = planned
+        async with semaphore:
+            # Exports only read data, so they are safe to retry
+            response = await client.post(
+                url,
+                json={**payload_dict, "gridDefinition": grid_definition},
+                auth=(username, password),
+                retry=True
+            )
+        if response.status_code != 200:
+            logging.error(f"Error exporting sub-slice: {response.text}")
+            raise HTTPException(status_code=response.status_code, detail=response.text)
+        return pov_member, response.json()
+
+    results = await asyncio.gather(*(export_slice(planned) for planned in slices))
+    return merge_export_slices(results, payload_dict["gridDefinition"], split_dimension)
+
+
+async def export_data_slice_json(
         base_url: str,
         username: str,
         password: str,
         app_name: str,
         api_version: str,
         plan_type_name: str,
-        payload: str):
+        payload: str,
+        max_cells: int = None,
+        split_dimension: str = None,
+        max_workers: int = DEFAULT_SLICE_WORKERS,
+        cache: bool = False,
+        refresh_cache: bool = False):
+    """
+    Export a data slice. With `cache`, the result is served from and stored in the
+    export cache, keyed by base URL, application, plan type, payload and credentials;
+    `refresh_cache` skips the lookup and replaces the cached result.
+    """
     try:
         payload_dict = json.loads(payload)  # Converting JSON string to dict
     except json.JSONDecodeError:
@@ -24,26 +230,116 @@ def export_data_slice_json(
 
     url = f"{base_url}/rest/{api_version}/applications/{app_name}/plantypes/{plan_type_name}/exportdataslice"
 
-    response = requests.post(
-        url,
-        json=payload_dict,
-        auth=(username, password)
-    )
+    cache_key = None
+    if cache or refresh_cache:
+        # Splitting on a POV dimension adds it to the row headers, so the split is part of the key
+        cache_key = export_cache_key(base_url, app_name, plan_type_name, payload_dict, username, password,
+                                     max_cells=max_cells, split_dimension=split_dimension if max_cells else None)
+        data = None if refresh_cache else export_cache.get(cache_key)
+        if data is not None:
+            logging.info(f"Export from {plan_type_name} served from the cache")
+            return {"status": "success", "data": data}
 
-    if response.status_code == 200:
-        return {"status": "success", "data": response.json()}
+    if max_cells:
+        # Split the grid into sub-slices under the cell budget and export them concurrently
+        slices = plan_export_slices(payload_dict["gridDefinition"], max_cells, split_dimension)
+        logging.info(f"Exporting {len(slices)} sub-slices from {plan_type_name}")
+        data = await export_slices_concurrently(url, username, password, payload_dict, slices, max_workers,
+                                                split_dimension)
     else:
-        raise HTTPException(status_code=response.status_code, detail=response.text)
+        response = await get_epm_client().post(
+            url,
+            json=payload_dict,
+            auth=(username, password),
+            retry=True
+        )
+        if response.status_code != 200:
+            raise HTTPException(status_code=response.status_code, detail=response.text)
+        data = response.json()
+
+    if cache_key:
+        export_cache.put(cache_key, data)
+    return {"status": "success", "data": data}
+
+
+DEFAULT_IMPORT_RETRIES = 2
+
+
+def plan_import_batches(payload_dict, batch_size):
+    """
+    Split an importdataslice payload into payloads of at most `batch_size` dataGrid rows.
+    The POV, columns and import options are repeated in every batch.
+    """
+    rows = payload_dict["dataGrid"].get("rows", [])
+    batches = []
+    for start in range(0, max(1, len(rows)), batch_size):
+        batch = {**payload_dict, "dataGrid": {**payload_dict["dataGrid"], "rows": rows[start:start + batch_size]}}
+        batches.append(batch)
+    return batches
+
+
+async def import_batches_concurrently(url, username, password, batches, max_workers=DEFAULT_SLICE_WORKERS,
+                                      max_retries=DEFAULT_IMPORT_RETRIES):
+    """
+    Post import batches with at most `max_workers` in flight over the shared EPM client.
+    Failed batches are retried up to `max_retries` more times without resending the
+    batches that succeeded. Returns aggregate accepted/rejected cell counts together
+    with the outcome of each batch.
+    """
+    client = get_epm_client()
+    semaphore = asyncio.Semaphore(max_workers)
+    outcomes = [{"batch": i, "rows": len(batch["dataGrid"]["rows"]), "status": "pending", "attempts": 0}
+                for i, batch in enumerate(batches)]
+
+    async def import_batch(index):
+        outcome = outcomes[index]
+        outcome["attempts"] += 1
+        try:
+            async with semaphore:
+                # Failed batches are retried below, so the client must not resend them too
+                response = await client.post(url, json=batches[index], auth=(username, password), retry=False)
+        except httpx.HTTPError as e:
+            outcome.update(status="failed", detail=str(e))
+            return
+        if response.status_code == 200:
+            result = response.json()
+            outcome.update(status="success",
+                           numAcceptedCells=result.get("numAcceptedCells", 0),
+                           numRejectedCells=result.get("numRejectedCells", 0),
+                           rejectedCells=result.get("rejectedCells", []))
+            outcome.pop("detail", None)
+        else:
+            logging.error(f"Error importing batch {index}: {response.text}")
+            outcome.update(status="failed", detail=response.text)
 
+    pending = list(range(len(batches)))
+    for _ in range(max_retries + 1):
+        await asyncio.gather(*(import_batch(index) for index in pending))
+        pending = [i for i in pending if outcomes[i]["status"] != "success"]
+        if not pending:
+            break
+        logging.info(f"Retrying {len(pending)} failed import batches")
+
+    succeeded = [o for o in outcomes if o["status"] == "success"]
+    return {
+        "status": "success" if len(succeeded) == len(outcomes) else "partial" if succeeded else "failed",
+        "numAcceptedCells": sum(o["numAcceptedCells"] for o in succeeded),
+        "numRejectedCells": sum(o["numRejectedCells"] for o in succeeded),
+        "batches": outcomes
+    }
 
-def import_data_slice_json(
+
+async def import_data_slice_json(
         base_url: str,
         username: str,
         password: str,
         app_name: str,
         api_version: str,
         plan_type_name: str,
-        payload: str):
+        payload: str,
+        batch_size: int = None,
+        max_workers: int = DEFAULT_SLICE_WORKERS,
+        max_retries: int = DEFAULT_IMPORT_RETRIES):
     try:
         # Convert JSON string to dict
         payload_dict = json.loads(payload)
@@ -53,8 +349,17 @@ def import_data_slice_json(
     # Construct the URL for the importdataslice endpoint
     url = f"{base_url}/rest/{api_version}/applications/{app_name}/plantypes/{plan_type_name}/importdataslice"
 
+    # Cached exports of this plan type no longer reflect its data once the import starts
+    export_cache.invalidate(base_url, app_name, plan_type_name)
+
+    if batch_size:
+        # Send the dataGrid rows in batches, retrying only the batches that fail
+        batches = plan_import_batches(payload_dict, batch_size)
+        logging.info(f"Importing {len(batches)} batches to {plan_type_name}")
+        return await import_batches_concurrently(url, username, password, batches, max_workers, max_retries)
+
     # Send the POST request to the importdataslice endpoint
-    response = requests.post(
+    response = await get_epm_client().post(
         url,
         json=payload_dict,
         auth=(username, password)
@@ -70,7 +375,6 @@ def import_data_slice_json(
 
 
 async def run_job(
-        background_tasks: BackgroundTasks,
         base_url: str,
         api_version: str,
         application: str,
@@ -79,8 +383,9 @@ async def run_job(
         username: str,
         password: str,
         parameters: str,  # Accepting parameters as a JSON string
-        poll_interval: int = 10,  # Default poll interval in seconds
-        max_retries: int = 30  # Default maximum number of retries
+        poll_interval: int = DEFAULT_POLL_INTERVAL,  # Initial poll interval in seconds
+        max_retries: int = DEFAULT_MAX_POLLS,  # Maximum number of status polls
+        wait: bool = False  # Wait for the job to finish instead of returning once it is submitted
 ):
     # Construct the URL for the jobs endpoint
     url = f"{base_url}/rest/{api_version}/applications/{application}/jobs"
@@ -99,11 +404,13 @@ async def run_job(
         except json.JSONDecodeError:
             return {"detail": "Malformed JSON in parameters field"}
 
-    # Send the POST request to the jobs endpoint with basic authentication
-    job_submission_response = requests.post(
+    # Send the POST request to the jobs endpoint with basic authentication. A gateway
+    # error may come back after EPM accepted the job, so it is never resubmitted
+    job_submission_response = await get_epm_client().post(
         url,
         json=payload,
-        auth=(username, password)
+        auth=(username, password),
+        retry=False
     )
 
     # Check the submission response status and capture the jobID
@@ -111,54 +418,13 @@ async def run_job(
         job_info = job_submission_response.json()
         job_id = job_info.get("jobId")
 
-        # Schedule the background task to poll the job status
-        background_tasks.add_task(
-            poll_job_status,
-            base_url,
-            api_version,
-            application,
-            job_id,
-            username,
-            password,
-            poll_interval,
-            max_retries
-        )
+        # Hand the job to the tracker, which polls all jobs from one task and records their states
+        job_tracker.track(base_url, api_version, application, job_id, username, password, job_name,
+                          poll_interval, max_retries)
+        if wait:
+            return await job_tracker.wait(job_id)
         return {"message": "Job submitted successfully", "jobId": job_id}
     else:
         # Log the error details for troubleshooting
         logging.error(f"Error in job submission /run_job/: {job_submission_response.text}")
         raise HTTPException(status_code=job_submission_response.status_code, detail=job_submission_response.text)
-
-
-def poll_job_status(base_url, api_version, application, job_id, username, password, poll_interval, max_retries):
-    job_status_url = f"{base_url}/rest/{api_version}/applications/{application}/jobs/{job_id}"
-    job_status = -1  # Initialize with -1 (in progress)
-    retry_count = 0  # Initialize retry count
-    job_descriptive_status = "Unknown"  # Initialize descriptive status
-
-    while job_status == -1 and retry_count < max_retries:
-        response = requests.get(
-            job_status_url,
-            auth=(username, password)
-        )
-        if response.status_code == 200:
-            job_details = response.json()
-            job_status = job_details.get("status")
-            job_descriptive_status = job_details.get("descriptiveStatus")
-            logging.info(f"Job {job_id} status: {job_descriptive_status}")
-
-            if job_status == -1:
-                # If the job is still in progress, wait for the poll_interval before the next poll
-                time.sleep(poll_interval)
-                retry_count += 1  # Increment the retry count
-            else:
-                # Handle final job status (success, error, cancelled, etc.)
-                logging.info(f"Final status for job {job_id}: {job_descriptive_status}")
-                # You might want to store the final status in a database or send a notification
-        else:
-            # Log error and break the loop if unable to poll the job status
-            logging.error(f"Error polling job status: {response.text}")
-            break
-
-    if retry_count >= max_retries:
-        logging.error(f"Max retries exceeded for job {job_id}. Last known status: {job_descriptive_status}")
\ No newline at end of file
@@ -0,0 +1,161 @@
+import contextlib
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from app.core.logging_engine import *
+
+DEFAULT_CACHE_TTL = 300
+DEFAULT_CACHE_ENTRIES = 32
+
+
+def export_scope(base_url, app_name, plan_type_name):
+    """
+    The part of an export cache key shared by every grid of one plan type.
+    """
+    return f"{base_url.rstrip('/')}|{app_name}|{plan_type_name}"
+
+
+def export_cache_key(base_url, app_name, plan_type_name, payload, username, password, **options):
+    """
+    Cache key of an export: the plan type's scope and a hash of the whole export
+    payload in canonical JSON form, so key order and whitespace do not matter. The
+    credentials are hashed with it, so a result is only served to a caller who could
+    export it from EPM with the same data access. Any `options` that change the shape
+    of the result (e.g. how the export was split) are hashed as well.
+    """
+    canonical = json.dumps([payload, username, password, options], sort_keys=True, separators=(',', ':'))
+    return f"{export_scope(base_url, app_name, plan_type_name)}|{hashlib.sha256(canonical.encode()).hexdigest()}"
+
+
+def _digest(text, length):
+    return hashlib.sha256(text.encode()).hexdigest()[:length]
+
+
+class ExportCache:
+    """
+    TTL and LRU bounded cache of exportdataslice results.
+
+    At most `max_entries` results are kept in memory, each for `ttl` seconds. With a
+    `directory`, results are also written there as JSON, so they survive the process
+    (e.g. between CLI runs) and are promoted back into memory when read. Cached grids
+    are shared with every caller that gets them and must not be modified.
+    """
+
+    def __init__(self, max_entries=DEFAULT_CACHE_ENTRIES, ttl=DEFAULT_CACHE_TTL, directory=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        # Files are prefixed by their scope so one plan type can be invalidated by name
+        scope = key.rsplit('|', 1)[0]
+        return os.path.join(self.directory, f"{_digest(scope, 16)}_{_digest(key, 32)}.json")
+
+    def get(self, key):
+        """
+        Return the cached result for `key`, or None if it is missing or expired.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self._entries.pop(key, None)
+
+        data = self._read_disk(key, now)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        self._remember(key, data, now)
+        return data
+
+    def put(self, key, data):
+        now = time.time()
+        self._remember(key, data, now)
+        if self.directory:
+            path = self._path(key)
+            with open(path + '.tmp', 'w') as cache_file:
+                json.dump({"key": key, "expiresAt": now + self.ttl, "data": data}, cache_file)
+            os.replace(path + '.tmp', path)
+
+    def _remember(self, key, data, now):
+        with self._lock:
+            self._entries[key] = (now + self.ttl, data)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _read_disk(self, key, now):
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            with open(path) as cache_file:
+                entry = json.load(cache_file)
+        except (OSError, ValueError):
+            return None
+        if entry.get("key") != key or entry.get("expiresAt", 0) <= now:
+            # Another process may already have removed it
+            with contextlib.suppress(OSError):
+                os.remove(path)
+            return None
+        return entry["data"]
+
+    def invalidate(self, base_url, app_name, plan_type_name):
+        """
+        Drop every cached export of one plan type, e.g. after data was imported into it.
+        """
+        scope = export_scope(base_url, app_name, plan_type_name)
+        with self._lock:
+            keys = [key for key in self._entries if key.rsplit('|', 1)[0] == scope]
+            for key in keys:
+                del self._entries[key]
+        paths = glob.glob(os.path.join(self.directory, f"{_digest(scope, 16)}_*.json")) if self.directory else []
+        for path in paths:
+            with contextlib.suppress(OSError):
+                os.remove(path)
+        if keys or paths:
+            logging.info(f"Invalidated the cached exports of {scope}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.directory:
+            for path in glob.glob(os.path.join(self.directory, "*.json")):
+                with contextlib.suppress(OSError):
+                    os.remove(path)
+
+    def render_prometheus(self):
+        with self._lock:
+            hits, misses, entries = self.hits, self.misses, len(self._entries)
+        return '\n'.join([
+            "# HELP epm_export_cache_hits_total Export results served from the cache.",
+            "# TYPE epm_export_cache_hits_total counter",
+            f"epm_export_cache_hits_total {hits}",
+            "# HELP epm_export_cache_misses_total Cached export lookups that went to EPM.",
+            "# TYPE epm_export_cache_misses_total counter",
+            f"epm_export_cache_misses_total {misses}",
+            "# HELP epm_export_cache_entries Export results held in memory.",
+            "# TYPE epm_export_cache_entries gauge",
+            f"epm_export_cache_entries {entries}",
+        ]) + '\n'
+
+
+export_cache = ExportCache(int(os.environ.get("EPM_EXPORT_CACHE_ENTRIES", DEFAULT_CACHE_ENTRIES)),
+                           float(os.environ.get("EPM_EXPORT_CACHE_TTL", DEFAULT_CACHE_TTL)),
+                           os.environ.get("EPM_EXPORT_CACHE_DIR"))
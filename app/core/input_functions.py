@@ -0,0 +1,81 @@
+import io
+import mmap
+import os
+from contextlib import contextmanager
+
+from app.core.logging_engine import *
+
+
+def is_path_input(source):
+    """
+    A source is treated as a file path when it is path-like, or a string without a
+    line break (CSV content always spans at least one header and one data line).
+    """
+    return isinstance(source, os.PathLike) or (isinstance(source, str) and '\n' not in source)
+
+
+def read_csv_header_lines(csv_file, header_rows):
+    """
+    Read the first `header_rows` lines from an open text or binary CSV handle,
+    leaving the handle positioned at the first data line.
+    """
+    header_lines = []
+    for _ in range(header_rows):
+        line = csv_file.readline()
+        if isinstance(line, bytes):
+            line = line.decode('utf-8-sig' if not header_lines else 'utf-8')
+        header_lines.append(line.rstrip('\r\n'))
+    return header_lines
+
+
+def count_remaining_lines(csv_file, block_size=2 ** 20):
+    """
+    Number of lines left in a seekable text or binary handle, counted a block at a
+    time and without moving its position. Returns None for unseekable streams.
+    """
+    if not getattr(csv_file, 'seekable', lambda: True)():
+        return None
+    try:
+        position = csv_file.tell()
+    except (AttributeError, OSError, ValueError):
+        return None
+
+    lines = 0
+    last = None
+    while True:
+        block = csv_file.read(block_size)
+        if not block:
+            break
+        lines += block.count(b'\n' if isinstance(block, bytes) else '\n')
+        last = block[-1:]
+    csv_file.seek(position)
+    # A final line without a line break still counts
+    return lines + int(last not in (None, b'\n', '\n'))
+
+
+@contextmanager
+def open_csv_input(source):
+    """
+    Yield a readable handle for a CSV source without copying it into memory.
+
+    Accepts a file path (opened and memory-mapped read-only), an open text or binary
+    stream such as an upload's spooled temporary file, raw bytes, or CSV text.
+    """
+    if is_path_input(source):
+        with open(source, 'rb') as csv_file:
+            try:
+                mapped = mmap.mmap(csv_file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files cannot be memory-mapped
+                yield csv_file
+                return
+            try:
+                yield mapped
+            finally:
+                mapped.close()
+    elif isinstance(source, str):
+        yield io.StringIO(source)
+    elif isinstance(source, (bytes, bytearray)):
+        yield io.BytesIO(source)
+    else:
+        yield source
@@ -0,0 +1,121 @@
+import json
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from app.core.logging_engine import *
+
+# Upper bounds (seconds) of the stage duration histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def peak_rss_bytes():
+    """
+    Peak resident set size of this process so far.
+    """
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+class StageMetrics:
+    """
+    Aggregated call counts, failures, row counts and duration histograms of each
+    instrumented stage, rendered in the Prometheus text exposition format.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def observe(self, stage, seconds, rows=None, failed=False):
+        with self._lock:
+            entry = self._stages.get(stage)
+            if entry is None:
+                entry = self._stages[stage] = {"count": 0, "failures": 0, "rows": 0, "seconds": 0.0,
+                                               "buckets": [0] * len(self.buckets)}
+            entry["count"] += 1
+            entry["failures"] += int(failed)
+            entry["rows"] += int(rows or 0)
+            entry["seconds"] += seconds
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    entry["buckets"][i] += 1
+
+    def render_prometheus(self):
+        with self._lock:
+            stages = {stage: dict(entry, buckets=list(entry["buckets"])) for stage, entry in self._stages.items()}
+
+        lines = ["# HELP epm_stage_duration_seconds Time spent in each pipeline stage.",
+                 "# TYPE epm_stage_duration_seconds histogram"]
+        for stage, entry in sorted(stages.items()):
+            for bound, count in zip(self.buckets, entry["buckets"]):
+                lines.append(f'epm_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+            lines.append(f'epm_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {entry["count"]}')
+            lines.append(f'epm_stage_duration_seconds_sum{{stage="{stage}"}} {entry["seconds"]}')
+            lines.append(f'epm_stage_duration_seconds_count{{stage="{stage}"}} {entry["count"]}')
+
+        for name, key, help_text in (("epm_stage_rows_total", "rows", "Rows processed by each pipeline stage."),
+                                     ("epm_stage_failures_total", "failures", "Pipeline stage runs that raised.")):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for stage, entry in sorted(stages.items()):
+                lines.append(f'{name}{{stage="{stage}"}} {entry[key]}')
+
+        lines += ["# HELP epm_process_peak_rss_bytes Peak resident set size of the process.",
+                  "# TYPE epm_process_peak_rss_bytes gauge",
+                  f"epm_process_peak_rss_bytes {peak_rss_bytes()}"]
+        return '\n'.join(lines) + '\n'
+
+
+stage_metrics = StageMetrics()
+# Lists collecting the observations of every span, see collect_observations
+_collectors = []
+
+
+@contextmanager
+def span(stage, timings=None, **fields):
+    """
+    Instrument one pipeline stage: its duration, the process peak RSS when it ends,
+    and whether it raised are logged as a JSON line and added to `stage_metrics`.
+
+    Extra keyword arguments are logged with the span, and the yielded dict can be
+    updated inside the block, e.g. with the number of `rows` the stage handled. When a
+    `timings` dict is passed, the stage's seconds are added to it under `stage`.
+    """
+    record = dict(fields)
+    failed = False
+    started = time.perf_counter()
+    try:
+        yield record
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + seconds
+        stage_metrics.observe(stage, seconds, record.get('rows'), failed)
+        for observations in _collectors:
+            observations.append((stage, seconds, record.get('rows'), failed))
+        logging.info(json.dumps({"span": stage, "seconds": round(seconds, 6), "peakRssBytes": peak_rss_bytes(),
+                                 "failed": failed, **record}, default=str))
+
+
+@contextmanager
+def collect_observations():
+    """
+    Collect the (stage, seconds, rows, failed) observation of every span that ends
+    inside the block in the yielded list, e.g. so a worker process can hand them back
+    to be replayed on the parent process's `stage_metrics`. Spans ended by other
+    threads meanwhile are collected too.
+    """
+    observations = []
+    _collectors.append(observations)
+    try:
+        yield observations
+    finally:
+        _collectors.remove(observations)
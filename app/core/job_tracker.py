@@ -0,0 +1,175 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+
+from app.core.epm_client import get_epm_client
+from app.core.logging_engine import *
+
+DEFAULT_POLL_INTERVAL = 10
+DEFAULT_MAX_POLL_INTERVAL = 120
+DEFAULT_BACKOFF_FACTOR = 1.5
+DEFAULT_MAX_POLLS = 30
+
+# EPM reports -1 while a job is still processing
+JOB_IN_PROGRESS = -1
+JOB_SUCCESS = 0
+# Registry states of jobs that are still being polled
+ACTIVE_STATES = ("running",)
+
+
+class JobRegistry:
+    """
+    Latest known state of each submitted EPM job, keyed by job id.
+
+    Records live in memory; when `db_path` is given they are also written to a SQLite
+    table and reloaded on start-up so job states survive a server restart. Jobs that
+    were still running are reloaded as "interrupted", as no poller tracks them any
+    more. Credentials are never stored in a record.
+    """
+
+    def __init__(self, db_path=None):
+        self._jobs = {}
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS jobs (job_id TEXT PRIMARY KEY, record TEXT NOT NULL)")
+            for job_id, record in self._db.execute("SELECT job_id, record FROM jobs").fetchall():
+                record = json.loads(record)
+                self._jobs[job_id] = record
+                if record.get("state") in ACTIVE_STATES:
+                    self.save(dict(record, state="interrupted"))
+
+    def get(self, job_id):
+        return self._jobs.get(str(job_id))
+
+    def all(self):
+        return list(self._jobs.values())
+
+    def save(self, record):
+        record["updatedAt"] = time.time()
+        self._jobs[str(record["jobId"])] = record
+        if self._db is not None:
+            with self._db:
+                self._db.execute("INSERT OR REPLACE INTO jobs (job_id, record) VALUES (?, ?)",
+                                 (str(record["jobId"]), json.dumps(record)))
+
+
+class JobTracker:
+    """
+    Polls every tracked job from a single asyncio task.
+
+    Each job starts at its own poll interval, which grows by `backoff_factor` after
+    every in-progress response up to `max_interval`, so long-running jobs are polled
+    less and less often. States are written to the registry as they change.
+    """
+
+    def __init__(self, registry, max_interval=DEFAULT_MAX_POLL_INTERVAL, backoff_factor=DEFAULT_BACKOFF_FACTOR):
+        self.registry = registry
+        self.max_interval = max_interval
+        self.backoff_factor = backoff_factor
+        self._watched = {}
+        self._finished = {}
+        self._wakeup = None
+        self._task = None
+
+    def track(self, base_url, api_version, application, job_id, username, password, job_name=None,
+              poll_interval=DEFAULT_POLL_INTERVAL, max_polls=DEFAULT_MAX_POLLS):
+        """
+        Start tracking a submitted job and return its registry record.
+        """
+        record = {
+            "jobId": job_id,
+            "jobName": job_name,
+            "application": application,
+            "state": "running",
+            "status": JOB_IN_PROGRESS,
+            "descriptiveStatus": "Submitted",
+            "polls": 0,
+            "submittedAt": time.time(),
+        }
+        self.registry.save(record)
+        self._watched[str(job_id)] = {
+            "url": f"{base_url}/rest/{api_version}/applications/{application}/jobs/{job_id}",
+            "auth": (username, password),
+            "interval": poll_interval,
+            "max_polls": max_polls,
+            "next_poll": time.monotonic() + poll_interval,
+        }
+        self._finished[str(job_id)] = asyncio.get_running_loop().create_future()
+        self._ensure_running()
+        return record
+
+    async def wait(self, job_id):
+        """
+        Wait until a tracked job reaches a final state and return its record.
+        """
+        return await asyncio.shield(self._finished[str(job_id)])
+
+    def _ensure_running(self):
+        if self._wakeup is None or self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        self._wakeup.set()
+
+    async def _run(self):
+        while self._watched:
+            now = time.monotonic()
+            due = [job_id for job_id, watch in self._watched.items() if watch["next_poll"] <= now]
+            await asyncio.gather(*(self._poll(job_id) for job_id in due))
+
+            if not self._watched:
+                break
+            delay = min(watch["next_poll"] for watch in self._watched.values()) - time.monotonic()
+            self._wakeup.clear()
+            try:
+                # Newly tracked jobs may be due sooner than the current earliest poll
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(0.0, delay))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _poll(self, job_id):
+        watch = self._watched[job_id]
+        record = dict(self.registry.get(job_id))
+        record["polls"] += 1
+        try:
+            response = await get_epm_client().get(watch["url"], auth=watch["auth"])
+        except Exception as e:
+            logging.error(f"Error polling job status for job {job_id}: {e}")
+            self._finish(job_id, {**record, "state": "error", "detail": str(e)})
+            return
+
+        if response.status_code != 200:
+            logging.error(f"Error polling job status: {response.text}")
+            self._finish(job_id, {**record, "state": "error", "detail": response.text})
+            return
+
+        job_details = response.json()
+        record.update(status=job_details.get("status"),
+                      descriptiveStatus=job_details.get("descriptiveStatus"),
+                      details=job_details)
+        logging.info(f"Job {job_id} status: {record['descriptiveStatus']}")
+
+        if record["status"] != JOB_IN_PROGRESS:
+            logging.info(f"Final status for job {job_id}: {record['descriptiveStatus']}")
+            self._finish(job_id, {**record, "state": "completed" if record["status"] == JOB_SUCCESS else "failed"})
+        elif record["polls"] >= watch["max_polls"]:
+            logging.error(f"Max retries exceeded for job {job_id}. "
+                          f"Last known status: {record['descriptiveStatus']}")
+            self._finish(job_id, {**record, "state": "timeout"})
+        else:
+            self.registry.save(record)
+            watch["next_poll"] = time.monotonic() + watch["interval"]
+            watch["interval"] = min(watch["interval"] * self.backoff_factor, self.max_interval)
+
+    def _finish(self, job_id, record):
+        self.registry.save(record)
+        del self._watched[job_id]
+        finished = self._finished.pop(job_id)
+        if not finished.done():
+            finished.set_result(record)
+
+
+# Set EPM_JOB_REGISTRY_DB to a SQLite file path to keep job states across restarts
+job_tracker = JobTracker(JobRegistry(os.environ.get("EPM_JOB_REGISTRY_DB")))
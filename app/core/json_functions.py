@@ -1,30 +1,168 @@
 import csv
 import io
 
+import ijson
+
 from app.core.logging_engine import *
 
+# Number of grid rows buffered before a chunk of CSV text is emitted
+CSV_CHUNK_ROWS = 1000
 
-def json_to_csv(json_data):
-    try:
-        logging.info("Inside json_to_csv function")
-        output = io.StringIO()
-        csv_writer = csv.writer(output)
 
-        # Determine the number of empty cells needed in the header
-        first_row_headers = json_data.get('rows', [])[0].get('headers', [])
-        empty_cells = len(first_row_headers)
+class GridCsvWriter:
+    """
+    Incrementally renders an exportdataslice grid as CSV.
+
+    Feed it ('columns', header_row) and ('rows', row) items in document order. Column
+    header rows are held back until the first data row arrives, since the number of
+    leading empty cells depends on how many row headers it has.
+    """
+
+    def __init__(self, chunk_rows=CSV_CHUNK_ROWS):
+        self.chunk_rows = chunk_rows
+        self._pending_columns = []
+        self._header_written = False
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+        self._buffered_rows = 0
+
+    def add(self, kind, value):
+        """
+        Add one grid item and return any CSV text that is ready to be emitted.
+        """
+        if kind == 'columns':
+            if self._header_written:
+                self._writerow([''] * self._empty_cells + value)
+            else:
+                self._pending_columns.append(value)
+        elif kind == 'rows':
+            headers = value.get('headers', [])
+            if not self._header_written:
+                self._write_header(len(headers))
+            self._writerow(headers + value.get('data', []))
+        return self._flush() if self._buffered_rows >= self.chunk_rows else ''
+
+    def close(self):
+        """
+        Return the remaining CSV text once all items have been added.
+        """
+        if not self._header_written:
+            self._write_header(0)
+        return self._flush()
 
+    def _write_header(self, empty_cells):
+        self._empty_cells = empty_cells
+        self._header_written = True
         # Write the Column headers
-        for col in json_data.get('columns', []):
-            csv_writer.writerow([''] * empty_cells + col)
+        for col in self._pending_columns:
+            self._writerow([''] * empty_cells + col)
+        self._pending_columns = []
+
+    def _writerow(self, values):
+        self._writer.writerow(values)
+        self._buffered_rows += 1
+
+    def _flush(self):
+        text = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        self._buffered_rows = 0
+        return text
+
+
+def iter_grid_items(json_data):
+    """
+    Yield the column header rows and data rows of an already parsed grid.
+    """
+    for col in json_data.get('columns', []):
+        yield 'columns', col
+    for row in json_data.get('rows', []):
+        yield 'rows', row
+
+
+class GridItemBuilder:
+    """
+    Turns ijson parse events into complete ('columns', header_row) and ('rows', row)
+    items, so only one header row or data row is ever materialised at a time.
+    """
+
+    def __init__(self):
+        self._builder = None
+        self._prefix = None
 
-        # Write Rows
-        for row in json_data.get('rows', []):
-            headers = row.get('headers', [])
-            data = row.get('data', [])
-            csv_writer.writerow(headers + data)
+    def event(self, prefix, event, value):
+        if self._builder is None:
+            if prefix in ('columns.item', 'rows.item') and event in ('start_array', 'start_map'):
+                self._builder = ijson.ObjectBuilder()
+                self._prefix = prefix
+                self._builder.event(event, value)
+            return None
 
-        return output.getvalue()
+        self._builder.event(event, value)
+        if prefix == self._prefix and event in ('end_array', 'end_map'):
+            item = (self._prefix.split('.')[0], self._builder.value)
+            self._builder = None
+            return item
+        return None
+
+
+def iter_grid_items_stream(json_file):
+    """
+    Yield grid items from a binary JSON stream as they are parsed.
+    """
+    builder = GridItemBuilder()
+    for prefix, event, value in ijson.parse(json_file, use_float=True):
+        item = builder.event(prefix, event, value)
+        if item:
+            yield item
+
+
+async def aiter_grid_items_stream(json_file):
+    """
+    Async variant of iter_grid_items_stream for objects with an async read().
+    """
+    builder = GridItemBuilder()
+    async for prefix, event, value in ijson.parse_async(json_file, use_float=True):
+        item = builder.event(prefix, event, value)
+        if item:
+            yield item
+
+
+def iter_csv_chunks(grid_items, chunk_rows=CSV_CHUNK_ROWS):
+    """
+    Yield the CSV text for a sequence of grid items in chunks of about `chunk_rows` lines.
+    """
+    writer = GridCsvWriter(chunk_rows)
+    for kind, value in grid_items:
+        text = writer.add(kind, value)
+        if text:
+            yield text
+    yield writer.close()
+
+
+async def aiter_csv_chunks(grid_items, chunk_rows=CSV_CHUNK_ROWS):
+    writer = GridCsvWriter(chunk_rows)
+    async for kind, value in grid_items:
+        text = writer.add(kind, value)
+        if text:
+            yield text
+    yield writer.close()
+
+
+def json_to_csv(json_data):
+    try:
+        logging.info("Inside json_to_csv function")
+        return ''.join(iter_csv_chunks(iter_grid_items(json_data)))
     except Exception as e:
         logging.error(f"Error in json_to_csv: {e}")
-        raise e
\ No newline at end of file
+        raise e
+
+
+def json_file_to_csv_file(json_path, csv_path):
+    """
+    Convert an exportdataslice response file to CSV, streaming from one file to the other.
+    """
+    logging.info(f"Converting {json_path} to {csv_path}")
+    with open(json_path, 'rb') as json_file, open(csv_path, 'w', newline='') as csv_file:
+        for text in iter_csv_chunks(iter_grid_items_stream(json_file)):
+            csv_file.write(text)
@@ -0,0 +1,117 @@
+import asyncio
+import json
+
+import pandas as pd
+
+from app.core.epm_functions import DEFAULT_SLICE_WORKERS, export_data_slice_json
+from app.core.instrumentation import span
+from app.core.logging_engine import *
+from app.core.snapshot_functions import snapshot_key
+from app.core.xlsx_functions import (EPM_MISSING_VALUES, ensure_unique_column_names,
+                                     save_frames_to_excel_with_hash_check)
+
+
+def grid_to_dataframe(grid, row_dimensions):
+    """
+    Build the frame read_and_process_csv would produce for the CSV of an
+    exportdataslice grid, without rendering or re-parsing the CSV.
+    """
+    rows = grid.get('rows', [])
+    header_count = len(rows[0].get('headers', [])) if rows else len(row_dimensions)
+
+    # Column names are the column members joined with "_", as for the CSV headers
+    measure_names = ['_'.join(filter(None, map(str, members))) for members in zip(*grid.get('columns', []))]
+    dimension_names = list(row_dimensions[:header_count]) + \
+        [f'Dimension{i + 1}' for i in range(len(row_dimensions), header_count)]
+    columns = ensure_unique_column_names(dimension_names + measure_names)
+
+    headers = pd.DataFrame([row.get('headers', []) for row in rows], columns=columns[:header_count], dtype=object)
+    data = pd.DataFrame([row.get('data', []) for row in rows], columns=columns[header_count:], dtype=object)
+    # Missing markers, and the empty cells of merged sub-slices, become NaN
+    data = data.mask(data.isin(EPM_MISSING_VALUES)).apply(pd.to_numeric, errors='coerce').astype('float64')
+
+    df = pd.concat([headers.astype('category'), data], axis=1)
+    return df[columns]
+
+
+async def reconcile(source, target, excel_path, row_dimensions, tolerance=0.0, streaming=False,
+                    skip_on_match=False, snapshot_dir=None):
+    """
+    Export the source and target slices concurrently and compare them in memory.
+
+    `source` and `target` are dicts of export_data_slice_json arguments (base_url,
+    username, password, app_name, api_version, plan_type_name, payload and optionally
+    max_cells, split_dimension, max_workers, cache). With `snapshot_dir`, only intersections
+    changed since the last run for the source application, plan type and POV are
+    compared. Returns the match status code together with the seconds spent in each
+    stage.
+    """
+    timings = {}
+
+    with span('export', timings):
+        source_export, target_export = await asyncio.gather(export_data_slice_json(**source),
+                                                            export_data_slice_json(**target))
+    for side, export in (('source', source_export), ('target', target_export)):
+        if 'data' not in export:
+            raise ValueError(f"Export of the {side} slice failed: {export.get('detail')}")
+
+    def compare():
+        with span('to_frames', timings) as record:
+            df_source = grid_to_dataframe(source_export['data'], row_dimensions)
+            df_target = grid_to_dataframe(target_export['data'], row_dimensions)
+            record['rows'] = len(df_source) + len(df_target)
+
+        status_code = save_frames_to_excel_with_hash_check(df_source, df_target, excel_path, row_dimensions,
+                                                           tolerance=tolerance, streaming=streaming,
+                                                           skip_on_match=skip_on_match, snapshot_dir=snapshot_dir,
+                                                           snapshot_key=reconcile_snapshot_key(source),
+                                                           timings=timings)
+        return status_code, len(df_source), len(df_target)
+
+    # The comparison is CPU bound, so keep it off the event loop
+    status_code, source_rows, target_rows = await asyncio.to_thread(compare)
+    logging.info(f"Reconciliation finished with status {status_code} in {sum(timings.values()):.2f}s")
+    return {
+        "status_code": status_code,
+        "source_rows": source_rows,
+        "target_rows": target_rows,
+        "timings": timings
+    }
+
+
+def reconcile_snapshot_key(source):
+    """
+    Snapshot key of a reconciliation: the source application, plan type and POV members.
+    """
+    try:
+        pov_members = json.loads(source["payload"])["gridDefinition"]["pov"]["members"]
+    except (ValueError, KeyError, TypeError):
+        pov_members = []
+    return snapshot_key(source["app_name"], source["plan_type_name"],
+                        ['|'.join(map(str, members)) for members in pov_members])
+
+
+def build_reconcile_side(base_url, username, password, app_name, api_version, plan_type_name, payload,
+                         max_cells=None, split_dimension=None, max_workers=DEFAULT_SLICE_WORKERS, cache=False,
+                         defaults=None):
+    """
+    Collect export_data_slice_json arguments for one side of a reconciliation, taking
+    any argument left as None from `defaults` (the other side).
+    """
+    side = {
+        "base_url": base_url,
+        "username": username,
+        "password": password,
+        "app_name": app_name,
+        "api_version": api_version,
+        "plan_type_name": plan_type_name,
+        "payload": payload,
+        "max_cells": max_cells,
+        "split_dimension": split_dimension,
+        "max_workers": max_workers,
+        "cache": cache,
+    }
+    for key, value in (defaults or {}).items():
+        if side[key] is None:
+            side[key] = value
+    return side
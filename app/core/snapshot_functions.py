@@ -0,0 +1,115 @@
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+from app.core.compare_functions import group_checksums, key_hashes, row_hashes
+from app.core.logging_engine import *
+
+SIDES = ('source', 'target')
+
+
+def snapshot_key(application, plan_type, pov_members=()):
+    """
+    Key identifying one reconciled slice: application, plan type and POV members.
+    """
+    return '/'.join([str(application), str(plan_type)] + [str(member) for member in pov_members])
+
+
+class SnapshotStore:
+    """
+    Per-row hashes of the last comparison of each slice, one Parquet file per
+    snapshot key in `directory`.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest()[:32] + '.parquet')
+
+    def load(self, key):
+        path = self.path(key)
+        return pd.read_parquet(path) if os.path.exists(path) else None
+
+    def save(self, key, snapshot):
+        # Write then rename, so a failed run never leaves a truncated snapshot behind
+        path = self.path(key)
+        snapshot.to_parquet(path + '.tmp', index=False)
+        os.replace(path + '.tmp', path)
+
+
+def build_snapshot(df_source, df_target, row_dimensions):
+    """
+    Snapshot of both sides of a comparison: one (side, key_hash, row_hash) row per
+    intersection, where key_hash identifies the intersection and row_hash its values.
+    """
+    sides = []
+    for side, df in zip(SIDES, (df_source, df_target)):
+        sides.append(pd.DataFrame({
+            'side': side,
+            'key_hash': key_hashes(df, row_dimensions),
+            'row_hash': row_hashes(df, row_dimensions),
+        }))
+    return pd.concat(sides, ignore_index=True)
+
+
+def aggregate_row_hashes(snapshot):
+    """
+    One row per key hash of one side of a snapshot, with the count and the wrapping
+    sum and xor of its row hashes, so repeated intersections compare as one whatever
+    their order.
+    """
+    ids, keys = pd.factorize(snapshot['key_hash'].to_numpy(dtype=np.uint64))
+    checksum_sum, checksum_xor = group_checksums(ids, snapshot['row_hash'].to_numpy(dtype=np.uint64), len(keys))
+    return pd.DataFrame({'key_hash': keys, 'rows': np.bincount(ids, minlength=len(keys)),
+                         'checksum_sum': checksum_sum, 'checksum_xor': checksum_xor})
+
+
+def diff_snapshots(previous, current):
+    """
+    Return the key hashes of intersections added, removed or changed on either side
+    since `previous`, with per-side counts of each. An intersection repeated on a side
+    has changed if its number of rows or any of their values did.
+    """
+    changed_keys = []
+    stats = {}
+    for side in SIDES:
+        before = aggregate_row_hashes(previous[previous['side'] == side])
+        after = aggregate_row_hashes(current[current['side'] == side])
+        added = after['key_hash'][~after['key_hash'].isin(before['key_hash'])].to_numpy(dtype=np.uint64)
+        removed = before['key_hash'][~before['key_hash'].isin(after['key_hash'])].to_numpy(dtype=np.uint64)
+        # An inner merge keeps the hashes as uint64, which an outer merge would turn into floats.
+        # Keys are unique per side after the aggregation, so it never multiplies rows.
+        both = before.merge(after, on='key_hash', suffixes=('_previous', '_current'))
+        differs = np.zeros(len(both), dtype=bool)
+        for column in ('rows', 'checksum_sum', 'checksum_xor'):
+            differs |= both[f'{column}_previous'].to_numpy() != both[f'{column}_current'].to_numpy()
+        changed = both.loc[differs, 'key_hash'].to_numpy(dtype=np.uint64)
+        stats[side] = {'added': len(added), 'removed': len(removed), 'changed': len(changed)}
+        changed_keys.extend([added, removed, changed])
+    return np.unique(np.concatenate(changed_keys)), stats
+
+
+def select_changed_rows(df_source, df_target, row_dimensions, store, key):
+    """
+    Diff both frames against the stored snapshot for `key` and keep only the rows of
+    intersections that changed since it was taken. Without a previous snapshot both
+    frames are returned whole. The current snapshot is returned as well, for the
+    caller to save once the comparison has been written.
+    """
+    current = build_snapshot(df_source, df_target, row_dimensions)
+    previous = store.load(key)
+    if previous is None:
+        logging.info(f"No snapshot for {key}, comparing all intersections")
+        return df_source, df_target, current
+
+    changed_keys, stats = diff_snapshots(previous, current)
+    logging.info(f"Changes since the last snapshot of {key}: {stats}")
+    source_keys = current.loc[current['side'] == 'source', 'key_hash'].to_numpy()
+    target_keys = current.loc[current['side'] == 'target', 'key_hash'].to_numpy()
+    return (df_source[np.isin(source_keys, changed_keys)].reset_index(drop=True),
+            df_target[np.isin(target_keys, changed_keys)].reset_index(drop=True),
+            current)
@@ -1,13 +1,23 @@
-import hashlib
+import os
 from io import StringIO
 
+import numpy as np
 import pandas as pd
 from openpyxl import load_workbook
 from openpyxl.styles import PatternFill
 from openpyxl.formatting.rule import CellIsRule
 from openpyxl.utils import get_column_letter
 
+from app.core.columnar_functions import columnar_format_of, read_columnar, write_columnar
+from app.core.compare_functions import (compare_frames, compare_frames_long, compare_frames_parallel, content_hash,
+                                         prune_matching_groups, select_exceptions, summarize_variances)
+from app.core.input_functions import count_remaining_lines, open_csv_input, read_csv_header_lines
+from app.core.instrumentation import span
 from app.core.logging_engine import *
+from app.core.snapshot_functions import SnapshotStore, select_changed_rows
+
+# Cell markers EPM writes for empty intersections
+EPM_MISSING_VALUES = ['#Missing', '#missing', '#MISSING']
 
 
 def ensure_unique_column_names(headers):
@@ -27,15 +37,23 @@ def ensure_unique_column_names(headers):
     return unique_headers
 
 
-def read_and_process_csv(csv_content, header_rows=2, row_dimensions=[]):
-    lines = csv_content.split('\n')
-    header_lines = lines[:header_rows]
-    data_lines = lines[header_rows:]
+def read_and_process_csv(csv_content, header_rows=2, row_dimensions=[], chunksize=100000):
+    """
+    Parse an EPM export into a DataFrame with one column per concatenated header.
+
+    `csv_content` may be a file path, an open text/binary stream or the CSV text (see
+    open_csv_input). The body is parsed in chunks with row dimensions as categoricals
+    and measures as float64, so a file or stream is never read into memory as a whole.
+    """
+    with open_csv_input(csv_content) as csv_file:
+        return parse_csv_stream(csv_file, int(header_rows), row_dimensions, chunksize)
 
-    header_str = '\n'.join(header_lines)
-    data_str = '\n'.join(data_lines)
 
-    header_df = pd.read_csv(StringIO(header_str), header=None)
+def parse_csv_stream(csv_file, header_rows, row_dimensions, chunksize):
+    """
+    Body of read_and_process_csv, working on an already opened handle.
+    """
+    header_df = pd.read_csv(StringIO('\n'.join(read_csv_header_lines(csv_file, header_rows))), header=None)
     concatenated_headers = ['_'.join(filter(None, header_df[col].astype(str))) for col in header_df.columns]
 
     # Assign row dimensions to the first N headers, then ensure all column names are unique
@@ -44,61 +62,54 @@ def read_and_process_csv(csv_content, header_rows=2, row_dimensions=[]):
             concatenated_headers[i] = dimension
     concatenated_headers = ensure_unique_column_names(concatenated_headers)
 
-    df = pd.read_csv(StringIO(data_str), names=concatenated_headers)
-    df = df.apply(pd.to_numeric, errors='ignore')
-
-    return df
-
-
-def check_row_failure(row):
-    # Check if any variance column in the row has a failure (not equal to 0 in this example)
-    for col in row.index:
-        if "_variance" in col and row[col] != 0:
-            return "fail"
-    return "success"
-
-
-def save_to_excel_with_hash_check(data_pull_csv, comparison_csv, excel_path, src_num_headers, tgt_num_headers,
-                                  row_dimensions):
-    # Process source and target CSVs
-    df_source = read_and_process_csv(data_pull_csv, src_num_headers, row_dimensions)
-    df_target = read_and_process_csv(comparison_csv, tgt_num_headers, row_dimensions)
-
-    # Perform hash check for exact match
-    hash_pull = hashlib.sha256(df_source.to_string().encode()).hexdigest()
-    hash_comp = hashlib.sha256(df_target.to_string().encode()).hexdigest()
-    match = hash_pull == hash_comp
-
-    # Set row_dimensions as index for comparison
-    df_source.set_index(row_dimensions, inplace=True)
-    df_target.set_index(row_dimensions, inplace=True)
-
-    comparison_df = df_source.join(df_target, how='outer', lsuffix='_source', rsuffix='_target')
-
-    for col in set([c.rsplit('_', 1)[0] for c in comparison_df.columns if '_source' in c]):
-        source_col = f'{col}_source'
-        target_col = f'{col}_target'
-        variance_col = f'{col}_variance'
-        notes_col = f'{col}_notes'
-
-        comparison_df[variance_col] = comparison_df[source_col].sub(comparison_df[target_col], fill_value=0)
-        comparison_df[notes_col] = comparison_df.apply(
-            lambda row: 'Data Match' if row[source_col] == row[target_col]
-            else 'Values do not match' if not pd.isna(row[source_col]) and not pd.isna(row[target_col])
-            else 'Data exists in source, not in target' if pd.isna(row[target_col])
-            else 'Data exists in target, not in source', axis=1
-        )
-
-        # Apply the check_row_failure function across the DataFrame rows
-        # Axis=1 specifies that the function should be applied to each row, not column
-        comparison_df['rowfailure'] = comparison_df.apply(check_row_failure, axis=1)
-
-    comparison_df.reset_index(inplace=True)
-
+    dimension_columns = concatenated_headers[:len(row_dimensions)]
+    dtypes = {col: 'float64' for col in concatenated_headers[len(row_dimensions):]}
+    dtypes.update({col: 'category' for col in dimension_columns})
+
+    # Fill preallocated columns chunk by chunk, so the chunks and the frame are never
+    # held at the same time; the line count is an upper bound on the rows
+    capacity = count_remaining_lines(csv_file) or chunksize
+    measures = {col: np.empty(capacity, dtype='float64') for col in concatenated_headers[len(row_dimensions):]}
+    codes = {col: np.empty(capacity, dtype='int32') for col in dimension_columns}
+    vocabularies = {col: {} for col in dimension_columns}
+    rows = 0
+    for chunk in pd.read_csv(csv_file, names=concatenated_headers, dtype=dtypes, na_values=EPM_MISSING_VALUES,
+                             chunksize=chunksize):
+        end = rows + len(chunk)
+        if end > capacity:
+            capacity = max(end, 2 * capacity)
+            for columns in (measures, codes):
+                for col, values in columns.items():
+                    columns[col] = np.concatenate([values[:rows], np.empty(capacity - rows, dtype=values.dtype)])
+        for col in measures:
+            measures[col][rows:end] = chunk[col].to_numpy()
+        for col in dimension_columns:
+            # Chunks carry their own categories, so map them onto one vocabulary in order of appearance
+            vocabulary = vocabularies[col]
+            for member in chunk[col].cat.categories:
+                vocabulary.setdefault(member, len(vocabulary))
+            mapping = np.append(np.fromiter((vocabulary[m] for m in chunk[col].cat.categories), dtype='int32',
+                                            count=len(chunk[col].cat.categories)), -1)
+            codes[col][rows:end] = mapping[chunk[col].cat.codes.to_numpy()]
+        rows = end
+
+    columns = {col: pd.Categorical.from_codes(codes[col][:rows], pd.Index(list(vocabularies[col]), dtype=object))
+               if col in codes else measures[col][:rows] for col in concatenated_headers}
+    return pd.DataFrame(columns, copy=False)
+
+
+def write_validation_workbook(excel_path, df_source, df_target, comparison_df, row_dimensions, extra_sheets=None):
+    """
+    Write Source, Target and Validation sheets with pandas, then re-open the workbook
+    to add conditional formatting, hide successful rows and freeze the panes. Frames in
+    `extra_sheets` ({sheet name: DataFrame}) are written as further plain sheets.
+    """
     with pd.ExcelWriter(excel_path, engine='openpyxl') as writer:
-        df_source.reset_index().to_excel(writer, sheet_name='Source', index=False)
-        df_target.reset_index().to_excel(writer, sheet_name='Target', index=False)
+        df_source.to_excel(writer, sheet_name='Source', index=False)
+        df_target.to_excel(writer, sheet_name='Target', index=False)
         comparison_df.to_excel(writer, sheet_name='Validation', index=False)
+        for sheet_name, df in (extra_sheets or {}).items():
+            df.to_excel(writer, sheet_name=sheet_name, index=False)
 
     # Load the workbook and select the sheet
     workbook = load_workbook(excel_path)
@@ -122,6 +133,10 @@ def save_to_excel_with_hash_check(data_pull_csv, comparison_csv, excel_path, src
         elif header_value and "rowfailure" in header_value:  # Adjust the condition based on your naming pattern
             failure_column.append(get_column_letter(col))
 
+    if sheet.max_row < 2:
+        # No data rows (e.g. nothing changed since the last snapshot), so there are no ranges to format
+        variance_columns, notes_columns, failure_column = [], [], []
+
     # Apply conditional formatting to identified variance columns
     for col in variance_columns:
         sheet.conditional_formatting.add(f'{col}2:{col}{sheet.max_row}',
@@ -155,5 +170,201 @@ def save_to_excel_with_hash_check(data_pull_csv, comparison_csv, excel_path, src
     # Save the workbook with conditional formatting
     workbook.save(excel_path)
 
-    print('Excel file created with three tabs: Source, Target, and Validation.')
+
+def write_frame_rows(worksheet, df, start_row=1, row_options=None, chunk_size=10000):
+    """
+    Stream the rows of a DataFrame into an xlsxwriter worksheet a chunk at a time,
+    writing missing values as empty cells. `row_options(chunk)` may return a list of
+    per-row option dicts (e.g. {'hidden': True}) for the chunk being written.
+    """
+    row_num = start_row
+    for chunk_start in range(0, len(df), chunk_size):
+        chunk = df.iloc[chunk_start:chunk_start + chunk_size]
+        options = row_options(chunk) if row_options else None
+        values = chunk.astype(object).where(chunk.notna(), None)
+        for i, row in enumerate(values.itertuples(index=False, name=None)):
+            if options and options[i]:
+                worksheet.set_row(row_num, None, None, options[i])
+            worksheet.write_row(row_num, 0, row)
+            row_num += 1
+
+
+def write_validation_workbook_streaming(excel_path, df_source, df_target, comparison_df, row_dimensions,
+                                        extra_sheets=None):
+    """
+    Single-pass variant of write_validation_workbook. Rows are streamed to disk with
+    xlsxwriter's constant_memory mode, and formatting, hidden rows and freeze panes are
+    emitted as the sheets are written, so the workbook is never re-opened.
+    """
+    import xlsxwriter
+
+    workbook = xlsxwriter.Workbook(excel_path, {'constant_memory': True})
+    header_format = workbook.add_format({'bold': True, 'border': 1, 'align': 'center'})
+    red_format = workbook.add_format({'bg_color': '#FFC7CE'})
+    green_format = workbook.add_format({'bg_color': '#C6EFCE'})
+
+    for sheet_name, df in (('Source', df_source), ('Target', df_target)):
+        sheet = workbook.add_worksheet(sheet_name)
+        sheet.write_row(0, 0, [str(c) for c in df.columns], header_format)
+        write_frame_rows(sheet, df)
+
+    sheet = workbook.add_worksheet('Validation')
+    sheet.write_row(0, 0, [str(c) for c in comparison_df.columns], header_format)
+
+    # Formatting ranges are known up front, so rules can be added before the rows
+    last_row = len(comparison_df)
+    for col_index, header_value in enumerate(comparison_df.columns if last_row else []):
+        if "_variance" in header_value:
+            value = '0'
+        elif "_notes" in header_value:
+            value = '"Data Match"'
+        elif "rowfailure" in header_value:
+            value = '"success"'
+        else:
+            continue
+        sheet.conditional_format(1, col_index, last_row, col_index,
+                                 {'type': 'cell', 'criteria': '!=', 'value': value, 'format': red_format})
+        sheet.conditional_format(1, col_index, last_row, col_index,
+                                 {'type': 'cell', 'criteria': '==', 'value': value, 'format': green_format})
+
+    def hide_successful_rows(chunk):
+        return [{'hidden': True} if status == "success" else None for status in chunk['rowfailure']]
+
+    write_frame_rows(sheet, comparison_df,
+                     row_options=hide_successful_rows if 'rowfailure' in comparison_df.columns else None)
+
+    # Freeze below the header and to the right of the row dimensions
+    sheet.freeze_panes(1, len(row_dimensions))
+
+    for sheet_name, df in (extra_sheets or {}).items():
+        sheet = workbook.add_worksheet(sheet_name)
+        sheet.write_row(0, 0, [str(c) for c in df.columns], header_format)
+        write_frame_rows(sheet, df)
+    workbook.close()
+
+
+def read_extract(source, header_rows, row_dimensions):
+    """
+    Load one side of a comparison: a Parquet/Arrow file written by an earlier run is
+    memory-mapped as-is, anything else is parsed as an EPM CSV export.
+    """
+    if columnar_format_of(source):
+        return read_columnar(source)
+    return read_and_process_csv(source, header_rows, row_dimensions)
+
+
+def save_frames_to_excel_with_hash_check(df_source, df_target, excel_path, row_dimensions, *, tolerance=0.0,
+                                         streaming=False, skip_on_match=False, columnar_format=None,
+                                         write_excel=True, snapshot_dir=None, snapshot_key=None, workers=1,
+                                         rollup_depth=None, long_format=False, exceptions_only=False, timings=None,
+                                         progress=None):
+    """
+    Compare already parsed source and target frames and write the workbook. The
+    options after `row_dimensions` are keyword-only.
+
+    With `columnar_format` ('parquet' or 'arrow') the Source, Target and Validation
+    frames are also written next to `excel_path`; set `write_excel` to False to write
+    only those. The columnar Source and Target are always the complete extracts, so
+    they can be reused as the next run's inputs. With `snapshot_dir`, only intersections that changed since the
+    snapshot stored under `snapshot_key` are joined and written, and the snapshot is
+    replaced afterwards. With `workers` above 1 the comparison is partitioned over that
+    many processes. With `rollup_depth`, both sides are first compared per group of
+    the leading row dimensions, one more dimension per level down to that depth, and
+    matching groups are pruned (see prune_matching_groups); the groups are listed on
+    a Rollup sheet. With
+    `long_format`, the join and variances run on the sparse long model of
+    compare_frames_long and only the output is pivoted wide. With `exceptions_only`,
+    only failing rows (and their source and target rows) are written, and a Summary
+    sheet totals the failures and variances per row-dimension member. When a `timings`
+    dict is passed, the seconds spent in each stage are recorded in it, and
+    `progress(stage)` is called as each stage starts.
+    """
+    progress = progress or (lambda stage: None)
+    progress('hashing')
+    # Kept before the snapshot, rollup and exceptions filters below narrow the frames
+    extracts = {'Source': df_source, 'Target': df_target}
+
+    # Perform hash check for exact match, independent of row order
+    with span('hash', timings, rows=len(df_source) + len(df_target)):
+        match = content_hash(df_source, row_dimensions) == content_hash(df_target, row_dimensions)
+
+    snapshot = None
+    if snapshot_dir:
+        with span('snapshot', timings) as record:
+            store = SnapshotStore(snapshot_dir)
+            snapshot_key = snapshot_key or os.path.splitext(os.path.basename(excel_path))[0]
+            df_source, df_target, snapshot = select_changed_rows(df_source, df_target, row_dimensions, store,
+                                                                 snapshot_key)
+            record['rows'] = len(df_source) + len(df_target)
+
+    if match and skip_on_match:
+        logging.info("Source and target contents match, skipping comparison workbook")
+        if snapshot is not None:
+            store.save(snapshot_key, snapshot)
+        return 200
+
+    extra_sheets = {}
+    if rollup_depth:
+        with span('rollup', timings, depth=rollup_depth) as record:
+            df_source, df_target, extra_sheets['Rollup'] = prune_matching_groups(df_source, df_target,
+                                                                                 row_dimensions, rollup_depth)
+            record['rows'] = len(df_source) + len(df_target)
+
+    progress('comparing')
+    compare = compare_frames_long if long_format else compare_frames
+    if workers > 1:
+        with span('compare', timings, workers=workers) as record:
+            comparison_df = compare_frames_parallel(df_source, df_target, row_dimensions, tolerance, workers, compare)
+            record['rows'] = len(comparison_df)
+    else:
+        comparison_df = compare(df_source, df_target, row_dimensions, tolerance, timings)
+
+    if exceptions_only:
+        with span('exceptions', timings) as record:
+            extra_sheets['Summary'] = summarize_variances(comparison_df, row_dimensions)
+            df_source, df_target, comparison_df = select_exceptions(df_source, df_target, comparison_df,
+                                                                    row_dimensions)
+            record['rows'] = len(comparison_df)
+
+    progress('writing')
+    if columnar_format:
+        with span('columnar_write', timings, rows=len(comparison_df), format=columnar_format):
+            write_columnar(excel_path, {**extracts, 'Validation': comparison_df, **extra_sheets}, columnar_format)
+
+    if write_excel:
+        with span('write', timings, rows=len(comparison_df), streaming=streaming):
+            if streaming:
+                write_validation_workbook_streaming(excel_path, df_source, df_target, comparison_df, row_dimensions,
+                                                   extra_sheets)
+            else:
+                write_validation_workbook(excel_path, df_source, df_target, comparison_df, row_dimensions,
+                                          extra_sheets)
+
+        print(f"Excel file created with tabs: {', '.join(['Source', 'Target', 'Validation', *extra_sheets])}.")
+
+    if snapshot is not None:
+        store.save(snapshot_key, snapshot)
     return 200 if match else 412
+
+
+def save_to_excel_with_hash_check(data_pull_csv, comparison_csv, excel_path, src_num_headers, tgt_num_headers,
+                                  row_dimensions, *, timings=None, progress=None, **options):
+    """
+    Compare source and target EPM extracts and write the Source/Target/Validation workbook.
+    Inputs may be file paths, open streams or CSV text (see open_csv_input), or paths
+    to Parquet/Arrow files written by an earlier run. The keyword `options` are those
+    of save_frames_to_excel_with_hash_check.
+    """
+    if progress:
+        progress('parsing')
+
+    # Process source and target extracts
+    with span('parse', timings, side='source') as record:
+        df_source = read_extract(data_pull_csv, src_num_headers, row_dimensions)
+        record['rows'] = len(df_source)
+    with span('parse', timings, side='target') as record:
+        df_target = read_extract(comparison_csv, tgt_num_headers, row_dimensions)
+        record['rows'] = len(df_target)
+
+    return save_frames_to_excel_with_hash_check(df_source, df_target, excel_path, row_dimensions, timings=timings,
+                                                progress=progress, **options)
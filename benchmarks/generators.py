@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+
+PERIODS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+
+def generate_column_headers(header_rows=2, periods=12, years=1):
+    """
+    Column header block of an EPM grid: one list per header row, one entry per column.
+    The first header row holds periods, the second years and any further rows a
+    single member of an extra column dimension.
+    """
+    columns = [(PERIODS[p % 12], f"FY{25 + y}") for y in range(years) for p in range(periods)]
+    headers = [[period for period, _ in columns]]
+    if header_rows > 1:
+        headers.append([year for _, year in columns])
+    for level in range(2, header_rows):
+        headers.append([f"Member{level}"] * len(columns))
+    return headers
+
+
+def generate_row_members(rows, row_dimensions=('Entity', 'Account'), members_per_dimension=50):
+    """
+    Distinct member combinations for `rows` rows, counting through the row
+    dimensions like digits (the last dimension takes whatever range remains).
+    """
+    index = np.arange(rows)
+    members = {}
+    for position, dimension in enumerate(row_dimensions):
+        if position < len(row_dimensions) - 1:
+            codes = index % members_per_dimension
+            index = index // members_per_dimension
+        else:
+            codes = index
+        prefix = dimension[0].upper()
+        members[dimension] = prefix + pd.Series(codes).astype(str).str.zfill(6)
+    return pd.DataFrame(members)
+
+
+def generate_extract_pair(rows, row_dimensions=('Entity', 'Account'), header_rows=2, periods=12, years=1,
+                          sparsity=0.3, variance_rate=0.01, missing_rate=0.005, seed=0):
+    """
+    Generate a source and target extract shaped like an EPM export.
+
+    `sparsity` is the share of empty cells, `variance_rate` the share of target
+    cells whose value differs from the source, and `missing_rate` the share of
+    intersections dropped from each side. Returns (column_headers, source, target)
+    where source and target are DataFrames of row members followed by measures.
+    """
+    rng = np.random.default_rng(seed)
+    column_headers = generate_column_headers(header_rows, periods, years)
+    measure_count = len(column_headers[0])
+
+    members = generate_row_members(rows, row_dimensions)
+    values = rng.random((rows, measure_count)) * 10000
+    values = np.round(values, 2)
+    values[rng.random((rows, measure_count)) < sparsity] = np.nan
+
+    target_values = values.copy()
+    changed = rng.random((rows, measure_count)) < variance_rate
+    target_values[changed] = np.round(target_values[changed] + rng.integers(1, 100, changed.sum()), 2)
+
+    measure_names = [f"m{i}" for i in range(measure_count)]
+    source = pd.concat([members, pd.DataFrame(values, columns=measure_names)], axis=1)
+    target = pd.concat([members, pd.DataFrame(target_values, columns=measure_names)], axis=1)
+    source = source[rng.random(rows) >= missing_rate]
+    target = target[rng.random(rows) >= missing_rate]
+    return column_headers, source.reset_index(drop=True), target.reset_index(drop=True)
+
+
+def write_extract_csv(path, column_headers, extract, row_dimension_count):
+    """
+    Write an extract as an EPM CSV: the header rows, padded by empty cells over the
+    row-dimension columns, followed by one line per intersection.
+    """
+    with open(path, 'w', newline='') as csv_file:
+        for header in column_headers:
+            csv_file.write(','.join([''] * row_dimension_count + header) + '\n')
+        extract.to_csv(csv_file, header=False, index=False)
+
+
+def extract_to_grid(column_headers, extract, row_dimension_count):
+    """
+    exportdataslice response for an extract, as json_to_csv expects it.
+    """
+    headers = extract.iloc[:, :row_dimension_count].to_numpy().tolist()
+    data = extract.iloc[:, row_dimension_count:].astype(object).where(extract.iloc[:, row_dimension_count:].notna(),
+                                                                      '#Missing').to_numpy().tolist()
+    return {
+        "pov": ["Actual", "Working"],
+        "columns": column_headers,
+        "rows": [{"headers": h, "data": d} for h, d in zip(headers, data)]
+    }
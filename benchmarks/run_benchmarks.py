@@ -0,0 +1,174 @@
+"""
+Benchmark the comparison pipeline on synthetic EPM extracts.
+
+Runs read_and_process_csv, save_to_excel_with_hash_check, csv_to_export_json and
+json_to_csv at each requested size and records wall time and peak memory per stage.
+Wall time is measured in an untraced run; peak memory in a second run under
+tracemalloc, since tracing slows Python-heavy stages down considerably.
+
+    python -m benchmarks.run_benchmarks --sizes 10000 100000 1000000 --output bench.json
+    python -m benchmarks.run_benchmarks --sizes 10000 --baseline bench.json
+"""
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+from app.core.csv_functions import csv_to_export_json
+from app.core.instrumentation import peak_rss_bytes
+from app.core.json_functions import json_to_csv
+from app.core.xlsx_functions import read_and_process_csv, save_to_excel_with_hash_check
+from benchmarks.generators import extract_to_grid, generate_extract_pair, write_extract_csv
+
+DEFAULT_SIZES = [10000, 100000, 1000000]
+
+
+def measure(stage, function, trace_memory=True):
+    """
+    Run `function` once for its wall time and, with `trace_memory`, once more under
+    tracemalloc for its peak allocation. Returns the stage result record.
+    """
+    gc.collect()
+    breakdown = {}
+    started = time.perf_counter()
+    function(breakdown)
+    record = {"stage": stage, "seconds": round(time.perf_counter() - started, 4)}
+    if breakdown:
+        record["breakdown"] = {name: round(seconds, 4) for name, seconds in breakdown.items()}
+
+    if trace_memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            function({})
+            record["peak_memory_mb"] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 2)
+        finally:
+            tracemalloc.stop()
+    record["process_max_rss_mb"] = round(peak_rss_bytes() / 2 ** 20, 2)
+    return record
+
+
+def benchmark_size(rows, args, work_dir):
+    """
+    Generate one source/target pair of `rows` rows and benchmark every stage on it.
+    """
+    row_dimensions = [f"Dim{i + 1}" for i in range(args.row_dims)]
+    col_dimensions = ['Period', 'Years'] + [f"Column{i + 1}" for i in range(2, args.header_rows)]
+    column_headers, source, target = generate_extract_pair(
+        rows, row_dimensions, args.header_rows, args.periods, args.years, args.sparsity, args.variance_rate,
+        args.missing_rate, args.seed)
+
+    source_path = os.path.join(work_dir, f"source_{rows}.csv")
+    target_path = os.path.join(work_dir, f"target_{rows}.csv")
+    excel_path = os.path.join(work_dir, f"comparison_{rows}.xlsx")
+    write_extract_csv(source_path, column_headers, source, len(row_dimensions))
+    write_extract_csv(target_path, column_headers, target, len(row_dimensions))
+    grid = extract_to_grid(column_headers, source, len(row_dimensions))
+    del source, target
+
+    stages = [
+        ("read_and_process_csv",
+         lambda timings: read_and_process_csv(source_path, args.header_rows, row_dimensions)),
+        ("save_to_excel_with_hash_check",
+         lambda timings: save_to_excel_with_hash_check(source_path, target_path, excel_path, args.header_rows,
+                                                       args.header_rows, row_dimensions, streaming=not args.openpyxl,
+                                                       write_excel=not args.no_excel, workers=args.workers,
+                                                       timings=timings)),
+        ("csv_to_export_json",
+         lambda timings: csv_to_export_json(source_path, "Scenario, Version", "Actual, Working",
+                                            ", ".join(col_dimensions), ", ".join(row_dimensions))),
+        ("json_to_csv",
+         lambda timings: json_to_csv(grid)),
+    ]
+
+    results = []
+    for stage, function in stages:
+        if args.stages and stage not in args.stages:
+            continue
+        record = measure(stage, function, trace_memory=not args.no_memory)
+        record["rows"] = rows
+        print(f"{rows:>9} rows  {stage:<30} {record['seconds']:>9.3f}s"
+              + (f"  {record['peak_memory_mb']:>9.1f} MB" if 'peak_memory_mb' in record else ''), flush=True)
+        results.append(record)
+    return results
+
+
+def current_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_with_baseline(results, baseline_path):
+    """
+    Print the time and memory ratio of each stage against a previous results file.
+    """
+    with open(baseline_path) as baseline_file:
+        baseline = {(r["rows"], r["stage"]): r for r in json.load(baseline_file)["results"]}
+    print(f"\nCompared with {baseline_path} (ratio > 1 is slower / larger):")
+    for record in results:
+        previous = baseline.get((record["rows"], record["stage"]))
+        if previous is None:
+            continue
+        line = f"{record['rows']:>9} rows  {record['stage']:<30} time x{record['seconds'] / max(previous['seconds'], 1e-9):.2f}"
+        if 'peak_memory_mb' in record and 'peak_memory_mb' in previous:
+            line += f"  memory x{record['peak_memory_mb'] / max(previous['peak_memory_mb'], 1e-9):.2f}"
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the EPM comparison pipeline on synthetic extracts")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="Row counts to benchmark")
+    parser.add_argument('--row-dims', type=int, default=3, help="Number of row dimensions")
+    parser.add_argument('--header-rows', type=int, default=2, help="Number of column header rows")
+    parser.add_argument('--periods', type=int, default=12, help="Periods per year")
+    parser.add_argument('--years', type=int, default=1, help="Years of periods")
+    parser.add_argument('--sparsity', type=float, default=0.3, help="Share of empty cells")
+    parser.add_argument('--variance-rate', type=float, default=0.01, help="Share of target cells that differ")
+    parser.add_argument('--missing-rate', type=float, default=0.005,
+                        help="Share of intersections dropped from each side")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--stages', nargs='+', help="Only run these stages")
+    parser.add_argument('--openpyxl', action='store_true',
+                        help="Write the workbook with openpyxl instead of the streaming writer")
+    parser.add_argument('--no-excel', action='store_true', help="Skip writing the workbook")
+    parser.add_argument('--workers', type=int, default=1, help="Worker processes for the comparison")
+    parser.add_argument('--no-memory', action='store_true', help="Skip the tracemalloc pass")
+    parser.add_argument('--output', default='bench_results.json', help="Path of the JSON results file")
+    parser.add_argument('--baseline', help="Previous results file to compare against")
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix='epm_bench_') as work_dir:
+        for rows in args.sizes:
+            results.extend(benchmark_size(rows, args, work_dir))
+
+    report = {
+        "generatedAt": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "commit": current_commit(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "config": {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+        "results": results,
+    }
+    with open(args.output, 'w') as output_file:
+        json.dump(report, output_file, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        compare_with_baseline(results, args.baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Benchmark CLI startup: `main.py --help` and a small `json-to-csv` conversion.
+
+Each command is run in a fresh interpreter several times and the median wall time
+is reported, together with which heavy libraries the command ended up importing.
+The run exits non-zero when a command's median exceeds `--max-seconds` or when it
+imports a heavy library, so it can guard startup latency in CI.
+
+    python -m benchmarks.startup --runs 10 --output startup.json
+    python -m benchmarks.startup --max-seconds 0.5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.generators import extract_to_grid, generate_extract_pair
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ('pandas', 'numpy', 'openpyxl', 'xlsxwriter', 'fastapi', 'httpx', 'pyarrow')
+DEFAULT_MAX_SECONDS = 0.5
+
+# Run main.py in-process after importing runpy only, then report the heavy modules loaded
+PROBE = """
+import runpy, sys
+sys.argv = ['main.py'] + sys.argv[1:]
+try:
+    runpy.run_path('main.py', run_name='__main__')
+except SystemExit:
+    pass
+print('\\n' + ','.join(m for m in {heavy!r} if m in sys.modules), file=sys.stderr)
+"""
+
+
+def time_command(arguments, runs):
+    """
+    Median wall time of `python main.py <arguments>` over `runs` fresh interpreters,
+    and the heavy modules it imported.
+    """
+    seconds = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, 'main.py'] + arguments, cwd=REPO_ROOT, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL, check=True)
+        seconds.append(time.perf_counter() - started)
+
+    probe = subprocess.run([sys.executable, '-c', PROBE.format(heavy=HEAVY_MODULES)] + arguments, cwd=REPO_ROOT,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True)
+    imported = probe.stderr.strip().splitlines()[-1] if probe.stderr.strip() else ''
+    return {
+        "command": ' '.join(['main.py'] + arguments),
+        "median_seconds": round(statistics.median(seconds), 4),
+        "min_seconds": round(min(seconds), 4),
+        "heavy_imports": [module for module in imported.split(',') if module],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark CLI startup time")
+    parser.add_argument('--runs', type=int, default=5, help="Runs per command")
+    parser.add_argument('--rows', type=int, default=100, help="Rows in the json-to-csv input")
+    parser.add_argument('--output', default='startup_results.json', help="Path of the JSON results file")
+    parser.add_argument('--max-seconds', type=float, default=DEFAULT_MAX_SECONDS,
+                        help="Fail when a command's median wall time exceeds this")
+    parser.add_argument('--allow-heavy-imports', action='store_true',
+                        help="Do not fail when a command imports a heavy library")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix='epm_startup_') as work_dir:
+        column_headers, source, _ = generate_extract_pair(args.rows, ['Entity', 'Account'])
+        json_path = os.path.join(work_dir, 'export.json')
+        with open(json_path, 'w') as json_file:
+            json.dump(extract_to_grid(column_headers, source, 2), json_file)
+
+        results = [
+            time_command(['--help'], args.runs),
+            time_command(['json-to-csv', '--file', json_path, '--output', os.path.join(work_dir, 'export.csv')],
+                         args.runs),
+        ]
+
+    for result in results:
+        print(f"{result['median_seconds']:>7.3f}s  {result['command'].replace(work_dir, '<tmp>')}  "
+              f"imports: {', '.join(result['heavy_imports']) or 'none'}")
+    with open(args.output, 'w') as output_file:
+        json.dump({"python": sys.version.split()[0], "runs": args.runs, "results": results}, output_file, indent=2)
+    print(f"Results written to {args.output}")
+
+    regressions = []
+    for result in results:
+        command = result['command'].replace(work_dir, '<tmp>')
+        if result['median_seconds'] > args.max_seconds:
+            regressions.append(f"{command} took {result['median_seconds']:.3f}s, over {args.max_seconds:.3f}s")
+        if result['heavy_imports'] and not args.allow_heavy_imports:
+            regressions.append(f"{command} imported {', '.join(result['heavy_imports'])}")
+    for regression in regressions:
+        print(f"Startup regression: {regression}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,12 +1,21 @@
 import json
+import sys
 
 from app.core.logging_engine import *
-from app.core.json_functions import *
-from app.core.csv_functions import *
-from app.core.xlsx_functions import *
-from app.core.epm_functions import *
+from app.core.columnar_functions import COLUMNAR_FORMATS
 import argparse
 
+# Each command imports the core modules it needs when it runs, so that e.g. --help and
+# json-to-csv start without loading pandas, openpyxl or the EPM client
+
+
+def given(**kwargs):
+    """
+    Keyword arguments that were set on the command line; the core functions' own
+    defaults apply to the rest.
+    """
+    return {key: value for key, value in kwargs.items() if value is not None}
+
 
 def run_cli():
     # Create the top-level parser
@@ -17,6 +26,7 @@ def run_cli():
     parser_json_to_csv = subparsers.add_parser('json-to-csv', help='Convert EPM JSON Data to CSV format')
     parser_json_to_csv.add_argument('--json_data', help='JSON data as a string', type=str)
     parser_json_to_csv.add_argument('--file', help='Path to a file with JSON data in it', type=str)
+    parser_json_to_csv.add_argument('--output', help='Path to write the CSV to, streaming from --file', type=str)
 
     parser_csv_to_json = subparsers.add_parser('csv-to-json', help='Convert CSV to EPM JSON Format')
     parser_csv_to_json.add_argument('--file', help='Path to a file with csv data in it', type=str)
@@ -26,12 +36,35 @@ def run_cli():
     parser_csv_to_json.add_argument('--row_dimensions', help='Path to a file with csv data in it', type=str)
 
     parser_save_to_excel = subparsers.add_parser('save-to-excel', help='Create Excel comparison file')
-    parser_save_to_excel.add_argument('--source', help='Path to source file with csv data in it', type=str)
-    parser_save_to_excel.add_argument('--target', help='Path to target file with csv data in it', type=str)
+    parser_save_to_excel.add_argument('--source', help='Path to source csv, parquet or arrow file', type=str)
+    parser_save_to_excel.add_argument('--target', help='Path to target csv, parquet or arrow file', type=str)
     parser_save_to_excel.add_argument('--excel-destination', help='Path to save Excel file', type=str)
-    parser_save_to_excel.add_argument('--srcHeaders', help='Number of Source Header Rows', type=str)
-    parser_save_to_excel.add_argument('--tgtHeaders', help='Number of Target Header Rows', type=str)
+    parser_save_to_excel.add_argument('--srcHeaders', help='Number of Source Header Rows', type=int)
+    parser_save_to_excel.add_argument('--tgtHeaders', help='Number of Target Header Rows', type=int)
     parser_save_to_excel.add_argument('--rowDims', help='Comma separated list of Row Dimension names', type=str)
+    parser_save_to_excel.add_argument('--tolerance', help='Absolute difference treated as a match', type=float,
+                                      default=0.0)
+    parser_save_to_excel.add_argument('--streaming', help='Write the workbook in a single constant-memory pass',
+                                      action='store_true')
+    parser_save_to_excel.add_argument('--skip-on-match', help='Skip the workbook when source and target match',
+                                      action='store_true')
+    parser_save_to_excel.add_argument('--columnar-format', help='Also write Source/Target/Validation in this format',
+                                      choices=COLUMNAR_FORMATS)
+    parser_save_to_excel.add_argument('--no-excel', help='Only write the columnar outputs', dest='write_excel',
+                                      action='store_false')
+    parser_save_to_excel.add_argument('--snapshot-dir', help='Only compare intersections changed since the snapshot '
+                                                             'stored in this directory', type=str)
+    parser_save_to_excel.add_argument('--workers', help='Number of processes to compare partitions in', type=int,
+                                      default=1)
+    parser_save_to_excel.add_argument('--snapshot-key', help='Snapshot name, e.g. application/plan type/POV '
+                                                             '(defaults to the Excel file name)', type=str)
+    parser_save_to_excel.add_argument('--rollup-depth', help='Compare group totals first, drilling down through '
+                                                             'this many leading row dimensions and skipping '
+                                                             'matching groups', type=int)
+    parser_save_to_excel.add_argument('--long-format', help='Compare on a sparse long model of the non-missing cells',
+                                      action='store_true')
+    parser_save_to_excel.add_argument('--exceptions-only', help='Only write failing rows, with a Summary sheet',
+                                      action='store_true')
 
     parser_export_slice = subparsers.add_parser('export-data-slice', help='Exports data from an Oracle EPM application')
     parser_export_slice.add_argument('--base_url', help='base application URL', type=str)
@@ -41,6 +74,15 @@ def run_cli():
     parser_export_slice.add_argument('--api_version', help='API version', type=str)
     parser_export_slice.add_argument('--plan_type_name', help='name of plan type to pull from', type=str)
     parser_export_slice.add_argument('--payload', help='Path to json export payload or json', type=str)
+    parser_export_slice.add_argument('--max_cells', help='Split the grid into sub-slices of at most this many cells',
+                                     type=int)
+    parser_export_slice.add_argument('--split_dimension', help='Row or POV dimension to split the grid on', type=str)
+    parser_export_slice.add_argument('--max_workers', help='Number of sub-slices exported concurrently',
+                                     type=int)
+    parser_export_slice.add_argument('--cache', help='Serve a repeated export from the export cache '
+                                                     '(kept across runs in $EPM_EXPORT_CACHE_DIR)', action='store_true')
+    parser_export_slice.add_argument('--refresh-cache', help='Skip the cached result and replace it',
+                                     action='store_true')
 
     parser_import_slice = subparsers.add_parser('import-data-slice', help='Imports data to an Oracle EPM application')
     parser_import_slice.add_argument('--base_url', help='base application URL', type=str)
@@ -50,6 +92,10 @@ def run_cli():
     parser_import_slice.add_argument('--api_version', help='API version', type=str)
     parser_import_slice.add_argument('--plan_type_name', help='name of plan type to import to', type=str)
     parser_import_slice.add_argument('--payload', help='Path to json import payload or json', type=str)
+    parser_import_slice.add_argument('--batch_size', help='Send the dataGrid rows in batches of this size', type=int)
+    parser_import_slice.add_argument('--max_workers', help='Number of batches imported concurrently',
+                                     type=int)
+    parser_import_slice.add_argument('--max_retries', help='Retries for each failed batch', type=int)
 
     parser_run_epm_job = subparsers.add_parser('run-epm-job', help='Runs an EPM Job')
     parser_run_epm_job.add_argument('--base_url', help='base application URL', type=str)
@@ -60,14 +106,51 @@ def run_cli():
     parser_run_epm_job.add_argument('--job_type', help='name of plan type to import to', type=str)
     parser_run_epm_job.add_argument('--job_name', help='name of plan type to import to', type=str)
     parser_run_epm_job.add_argument('--parameters', help='Path to json import payload or json', type=str)
-    parser_run_epm_job.add_argument('--poll_interval', help='Path to json import payload or json', type=str)
-    parser_run_epm_job.add_argument('--max_retries', help='Path to json import payload or json', type=str)
+    parser_run_epm_job.add_argument('--poll_interval', help='Initial seconds between job status polls',
+                                    type=int)
+    parser_run_epm_job.add_argument('--max_retries', help='Maximum number of job status polls',
+                                    type=int)
+
+    parser_reconcile = subparsers.add_parser('reconcile', help='Export two data slices and compare them in Excel')
+    for prefix, side in (('src', 'source'), ('tgt', 'target')):
+        default_note = '' if prefix == 'src' else ' (defaults to the source value)'
+        parser_reconcile.add_argument(f'--{prefix}_base_url', help=f'{side} base application URL{default_note}',
+                                      type=str)
+        parser_reconcile.add_argument(f'--{prefix}_username', help=f'{side} username{default_note}', type=str)
+        parser_reconcile.add_argument(f'--{prefix}_password', help=f'{side} password{default_note}', type=str)
+        parser_reconcile.add_argument(f'--{prefix}_app_name', help=f'{side} application{default_note}', type=str)
+        parser_reconcile.add_argument(f'--{prefix}_api_version', help=f'{side} API version{default_note}', type=str)
+        parser_reconcile.add_argument(f'--{prefix}_plan_type_name', help=f'{side} plan type{default_note}', type=str)
+        parser_reconcile.add_argument(f'--{prefix}_payload', help=f'{side} json export payload{default_note}',
+                                      type=str)
+    parser_reconcile.add_argument('--excel-destination', help='Path to save Excel file', type=str)
+    parser_reconcile.add_argument('--rowDims', help='Comma separated list of Row Dimension names', type=str)
+    parser_reconcile.add_argument('--max_cells', help='Split each export into sub-slices of at most this many cells',
+                                  type=int)
+    parser_reconcile.add_argument('--tolerance', help='Absolute difference treated as a match', type=float,
+                                  default=0.0)
+    parser_reconcile.add_argument('--streaming', help='Write the workbook in a single constant-memory pass',
+                                  action='store_true')
+    parser_reconcile.add_argument('--skip-on-match', help='Skip the workbook when source and target match',
+                                  action='store_true')
+    parser_reconcile.add_argument('--snapshot-dir', help='Only compare intersections changed since the snapshot '
+                                                         'stored in this directory', type=str)
+    parser_reconcile.add_argument('--cache', help='Serve repeated exports from the export cache '
+                                                  '(kept across runs in $EPM_EXPORT_CACHE_DIR)', action='store_true')
+
+    parser_batch_compare = subparsers.add_parser('batch-compare',
+                                                 help='Run the comparisons listed in a JSON or YAML manifest')
+    parser_batch_compare.add_argument('--manifest', help='Path to the JSON or YAML manifest', type=str, required=True)
+    parser_batch_compare.add_argument('--workers', help='Number of comparisons run concurrently '
+                                                        '(defaults to the manifest value)', type=int)
+    parser_batch_compare.add_argument('--report', help='Path to write the JSON run report to', type=str)
 
     # Parse the arguments
     args = parser.parse_args()
 
     # Handle each command
     if args.command == 'json-to-csv':
+        from app.core.json_functions import iter_csv_chunks, iter_grid_items_stream, json_file_to_csv_file, json_to_csv
         json_data = None
         if args.json_data:
             try:
@@ -80,11 +163,17 @@ def run_cli():
                 print(f"An error occurred: {str(e)}")
         elif args.file:
             try:
-                with open(args.file, 'r') as file:
-                    json_data = json.load(file)
+                if args.output:
+                    json_file_to_csv_file(args.file, args.output)
+                    print(f"JSON data converted to CSV: {args.output}")
+                else:
+                    print("JSON data converted to CSV:")
+                    with open(args.file, 'rb') as file:
+                        for text in iter_csv_chunks(iter_grid_items_stream(file)):
+                            sys.stdout.write(text)
             except Exception as e:
-                print(f"An error occurred while reading the file: {str(e)}")
-                return
+                print(f"An error occurred during conversion: {str(e)}")
+            return
 
         if json_data is not None:
             try:
@@ -96,6 +185,7 @@ def run_cli():
             print("No JSON data provided.")
 
     elif args.command == 'csv-to-json':
+        from app.core.csv_functions import csv_to_export_json
         csv_data = None
         csv_to_export_json(args.file,
                     args.pov_dimensions,
@@ -104,6 +194,9 @@ def run_cli():
                     args.row_dimensions)
 
     elif args.command == 'save-to-excel':
+        if not args.write_excel and not args.columnar_format:
+            parser_save_to_excel.error("--no-excel requires --columnar-format, otherwise nothing is written")
+        from app.core.xlsx_functions import save_to_excel_with_hash_check
         if args.rowDims:
             row_dimensions = args.rowDims.split(',')
         else:
@@ -113,30 +206,57 @@ def run_cli():
                                       args.excel_destination,
                                       args.srcHeaders,
                                       args.tgtHeaders,
-                                      row_dimensions)
+                                      row_dimensions,
+                                      tolerance=args.tolerance,
+                                      streaming=args.streaming,
+                                      skip_on_match=args.skip_on_match,
+                                      columnar_format=args.columnar_format,
+                                      write_excel=args.write_excel,
+                                      snapshot_dir=args.snapshot_dir,
+                                      snapshot_key=args.snapshot_key,
+                                      workers=args.workers,
+                                      rollup_depth=args.rollup_depth,
+                                      long_format=args.long_format,
+                                      exceptions_only=args.exceptions_only)
 
     elif args.command == 'export-data-slice':
-        export_data_slice_json(
+        from app.core.epm_client import run_with_epm_client
+        from app.core.epm_functions import export_data_slice_json
+        run_with_epm_client(export_data_slice_json(
             args.base_url,
             args.username,
             args.password,
             args.app_name,
             args.api_version,
             args.plan_type_name,
-            args.payload)
+            args.payload,
+            args.max_cells,
+            args.split_dimension,
+            cache=args.cache,
+            refresh_cache=args.refresh_cache,
+            **given(max_workers=args.max_workers)))
 
     elif args.command == 'import-data-slice':
-        import_data_slice_json(
+        from app.core.epm_client import run_with_epm_client
+        from app.core.epm_functions import import_data_slice_json
+        result = run_with_epm_client(import_data_slice_json(
             args.base_url,
             args.username,
             args.password,
             args.app_name,
             args.api_version,
             args.plan_type_name,
-            args.payload)
+            args.payload,
+            args.batch_size,
+            **given(max_workers=args.max_workers, max_retries=args.max_retries)))
+        if args.batch_size:
+            print(f"Accepted cells: {result['numAcceptedCells']}, rejected cells: {result['numRejectedCells']}, "
+                  f"status: {result['status']}")
 
     elif args.command == 'run-epm-job':
-        run_job(
+        from app.core.epm_client import run_with_epm_client
+        from app.core.epm_functions import run_job
+        job = run_with_epm_client(run_job(
             base_url=args.base_url,
             api_version=args.api_version,
             application=args.app_name,
@@ -145,8 +265,37 @@ def run_cli():
             username=args.username,
             password=args.password,
             parameters=args.parameters,
-            poll_interval=args.poll_interval,
-            max_retries=args.max_retries)
+            wait=True,
+            **given(poll_interval=args.poll_interval, max_retries=args.max_retries)))
+        print(f"Job {job.get('jobId')} finished: {job.get('descriptiveStatus')}")
+
+    elif args.command == 'reconcile':
+        from app.core.epm_client import run_with_epm_client
+        from app.core.reconcile_functions import build_reconcile_side, reconcile
+        source = build_reconcile_side(args.src_base_url, args.src_username, args.src_password, args.src_app_name,
+                                      args.src_api_version, args.src_plan_type_name, args.src_payload,
+                                      args.max_cells, cache=args.cache)
+        target = build_reconcile_side(args.tgt_base_url, args.tgt_username, args.tgt_password, args.tgt_app_name,
+                                      args.tgt_api_version, args.tgt_plan_type_name, args.tgt_payload,
+                                      args.max_cells, cache=args.cache, defaults=source)
+        row_dimensions = args.rowDims.split(',') if args.rowDims else []
+        result = run_with_epm_client(reconcile(source, target, args.excel_destination, row_dimensions,
+                                               args.tolerance, args.streaming, args.skip_on_match,
+                                               args.snapshot_dir))
+        print(f"Reconciliation status: {result['status_code']}")
+        for stage, seconds in result['timings'].items():
+            print(f"  {stage}: {seconds:.3f}s")
+
+    elif args.command == 'batch-compare':
+        from app.core.batch_functions import load_manifest, run_batch
+        report = run_batch(load_manifest(args.manifest), args.workers)
+        if args.report:
+            with open(args.report, 'w') as report_file:
+                json.dump(report, report_file, indent=2)
+        for entry in report['comparisons']:
+            print(f"{entry['name']}: {entry['status']} ({entry['status_code']}) in {entry['seconds']:.2f}s"
+                  + (f" - {entry['detail']}" if 'detail' in entry else ''))
+        print(f"Batch finished in {report['seconds']:.2f}s: {report['summary']}")
 
     else:
         parser.print_help()
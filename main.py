@@ -1,15 +1,16 @@
 from app.core.logging_engine import *
 import sys
-from app.api.initializeFastAPI import *
-from cli.initializeCLI import run_cli
 
 
 def main():
+    # The CLI and the server import their own dependencies, so a CLI run never loads FastAPI
     if len(sys.argv) > 1:
         # If there are command-line arguments, assume we want to run the CLI
+        from cli.initializeCLI import run_cli
         run_cli()
     else:
         # If no command-line arguments, run the FastAPI server
+        from app.api.initializeFastAPI import init_fastapi
         init_fastapi()
 
 
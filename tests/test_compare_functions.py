@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+
+from app.core.compare_functions import compare_frames, decode_dimensions, encode_dimensions, prune_matching_groups
+
+
+def frames_with_missing_members():
+    df_source = pd.DataFrame({'Entity': pd.Categorical(['E2', np.nan, 'E1', 'E1']),
+                              'Account': pd.Categorical(['A1', 'A2', np.nan, 'A2']),
+                              'Jan': [1.0, 2.0, 3.0, 6.0]})
+    df_target = pd.DataFrame({'Entity': pd.Categorical([np.nan, 'E1', 'E3']),
+                              'Account': pd.Categorical(['A2', np.nan, 'A1']),
+                              'Jan': [2.0, 4.0, 5.0]})
+    return df_source, df_target
+
+
+def test_encode_dimensions_round_trips_missing_members():
+    df_source, df_target = frames_with_missing_members()
+    source_keys, _, vocabularies = encode_dimensions(df_source, df_target, ['Entity', 'Account'])
+    decoded = decode_dimensions(source_keys, ['Entity', 'Account'], vocabularies)
+    for dimension in ('Entity', 'Account'):
+        assert decoded[dimension].astype(object).tolist() == df_source[dimension].astype(object).tolist()
+
+
+def test_compare_frames_sorts_missing_members_last():
+    df_source, df_target = frames_with_missing_members()
+    comparison_df = compare_frames(df_source, df_target, ['Entity', 'Account'])
+
+    keys = comparison_df[['Entity', 'Account']].astype(object).fillna('<missing>').values.tolist()
+    assert keys == [['E1', 'A2'], ['E1', '<missing>'], ['E2', 'A1'], ['E3', 'A1'], ['<missing>', 'A2']]
+    assert comparison_df['Jan_notes'].tolist()[-1] == 'Data Match'
+
+
+def frames_with_one_changed_cell():
+    rows = [(entity, account, product) for entity in ('E1', 'E2') for account in ('A1', 'A2')
+            for product in ('P1', 'P2')]
+    df_source = pd.DataFrame(rows, columns=['Entity', 'Account', 'Product'])
+    df_source['Jan'] = np.arange(1.0, len(rows) + 1)
+    df_target = df_source.copy()
+    df_target.loc[(df_target['Entity'] == 'E2') & (df_target['Account'] == 'A2')
+                  & (df_target['Product'] == 'P1'), 'Jan'] = 100.0
+    return df_source, df_target
+
+
+def test_prune_matching_groups_drills_down_to_the_changed_group():
+    df_source, df_target = frames_with_one_changed_cell()
+    row_dimensions = ['Entity', 'Account', 'Product']
+    pruned_source, pruned_target, rollup = prune_matching_groups(df_source, df_target, row_dimensions,
+                                                                 rollup_depth=3)
+
+    statuses = rollup.astype(object).where(rollup.notna(), '').values.tolist()
+    assert [row[:4] + row[-1:] for row in statuses] == [
+        ['E1', '', '', 1, 'pruned'],
+        ['E2', '', '', 1, 'expanded'],
+        ['E2', 'A1', '', 2, 'pruned'],
+        ['E2', 'A2', '', 2, 'expanded'],
+        ['E2', 'A2', 'P1', 3, 'compared'],
+        ['E2', 'A2', 'P2', 3, 'pruned'],
+    ]
+    assert len(pruned_source) == len(pruned_target) == 1
+
+    compared = rollup[rollup['status'] == 'compared'][row_dimensions].astype(object)
+    full = compare_frames(df_source, df_target, row_dimensions)
+    in_compared = full[row_dimensions].astype(object).merge(compared, how='left', indicator=True)['_merge'] == 'both'
+    expected = full[in_compared.to_numpy()].reset_index(drop=True)
+    assert len(expected) == 1
+    actual = compare_frames(pruned_source, pruned_target, row_dimensions)
+    pd.testing.assert_frame_equal(actual.astype(object), expected.astype(object), check_categorical=False)
+
+
+def test_prune_matching_groups_stops_when_everything_matches():
+    df_source, _ = frames_with_one_changed_cell()
+    pruned_source, pruned_target, rollup = prune_matching_groups(df_source, df_source.copy(),
+                                                                 ['Entity', 'Account', 'Product'], rollup_depth=3)
+    assert rollup['level'].tolist() == [1, 1]
+    assert (rollup['status'] == 'pruned').all()
+    assert pruned_source.empty and pruned_target.empty
@@ -0,0 +1,89 @@
+import os
+import time
+from io import BytesIO
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.endpoints import xlsx_endpoints
+from app.core import comparison_jobs as comparison_jobs_module
+from app.core.comparison_jobs import ComparisonJobQueue
+from app.core.instrumentation import StageMetrics
+from tests.test_xlsx_functions import ROW_DIMENSIONS, SOURCE_CSV, TARGET_CSV
+
+
+@pytest.fixture
+def queue():
+    queue = ComparisonJobQueue(max_workers=1)
+    yield queue
+    queue.shutdown()
+
+
+def submit(queue, **comparison_args):
+    return queue.submit(BytesIO(SOURCE_CSV.encode()), BytesIO(TARGET_CSV.encode()), src_num_headers=2,
+                        tgt_num_headers=2, row_dimensions=ROW_DIMENSIONS, **comparison_args)
+
+
+def wait_for(queue, job_id, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        record = queue.get(job_id)
+        if record["state"] not in ("queued", "running"):
+            return record
+        time.sleep(0.05)
+    raise AssertionError(f"Job {job_id} did not finish")
+
+
+def test_worker_spans_are_added_to_the_stage_metrics(queue, monkeypatch):
+    metrics = StageMetrics()
+    monkeypatch.setattr(comparison_jobs_module, 'stage_metrics', metrics)
+    record = wait_for(queue, submit(queue)["jobId"])
+
+    assert record["state"] == "completed"
+    assert record["statusCode"] == 412
+    assert {'parse', 'hash', 'join', 'write'} <= set(record["timings"])
+    exposition = metrics.render_prometheus()
+    assert 'epm_stage_duration_seconds_count{stage="parse"} 2' in exposition
+    assert 'epm_stage_rows_total{stage="parse"} 13' in exposition
+
+
+def test_variance_job_is_submitted_polled_and_downloaded(queue, monkeypatch):
+    monkeypatch.setattr(xlsx_endpoints, 'comparison_jobs', queue)
+    app = FastAPI()
+    app.include_router(xlsx_endpoints.router, prefix="/xlsx")
+    client = TestClient(app)
+
+    response = client.post("/xlsx/variance_jobs/",
+                           files={"data_pull_csv": ("source.csv", SOURCE_CSV), "comparison_csv": ("target.csv", TARGET_CSV)},
+                           data={"src_num_headers": 2, "tgt_num_headers": 2, "row_dimensions": ROW_DIMENSIONS})
+    assert response.status_code == 202
+    job_id = response.json()["jobId"]
+
+    deadline = time.time() + 60
+    while client.get(f"/xlsx/variance_jobs/{job_id}").json()["state"] in ("queued", "running"):
+        assert time.time() < deadline
+        time.sleep(0.05)
+    assert client.get(f"/xlsx/variance_jobs/{job_id}").json()["state"] == "completed"
+
+    download = client.get(f"/xlsx/variance_jobs/{job_id}/download")
+    assert download.status_code == 200
+    assert download.content.startswith(b"PK")
+    assert client.get("/xlsx/variance_jobs/unknown").status_code == 404
+
+
+def test_finished_jobs_expire_after_the_retention(queue):
+    queue.retention = 0
+    record = wait_for(queue, submit(queue)["jobId"])
+    assert record["state"] == "completed" and os.path.exists(record["excelPath"])
+
+    queue.sweep()
+    assert queue.get(record["jobId"])["state"] == "expired"
+    assert not os.path.exists(os.path.dirname(record["excelPath"]))
+
+
+def test_jobs_can_still_be_read_after_shutdown(queue):
+    queue.registry.save({"jobId": "queued", "state": "queued", "excelPath": "comparison.xlsx"})
+    queue._ensure_started()
+    queue.shutdown()
+    assert queue.get("queued")["state"] == "queued"
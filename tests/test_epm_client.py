@@ -0,0 +1,56 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.core.epm_client import EpmClient
+
+URL = "https://epm.example.com/rest/v3/applications/App/jobs"
+
+
+def send(method, responses, **kwargs):
+    """
+    Send one request through an EpmClient whose transport answers with `responses`
+    (status codes, or exceptions to raise) in turn. Returns the final status code and
+    the number of requests the transport received.
+    """
+    responses = list(responses)
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return httpx.Response(response)
+
+    async def run():
+        async with EpmClient(transport=httpx.MockTransport(handler), backoff_factor=0, max_retries=3) as client:
+            return await client.request(method, URL, **kwargs)
+
+    return asyncio.run(run()).status_code, len(calls)
+
+
+def test_idempotent_requests_are_retried():
+    assert send("GET", [503, 504, 200]) == (200, 3)
+
+
+def test_retries_stop_at_max_retries():
+    assert send("GET", [503] * 5) == (503, 4)
+
+
+def test_post_is_not_retried_by_default():
+    assert send("POST", [504, 200]) == (504, 1)
+
+
+def test_post_can_opt_in_to_retries():
+    assert send("POST", [503, 200], retry=True) == (200, 2)
+
+
+def test_post_is_resent_when_the_connection_failed():
+    assert send("POST", [httpx.ConnectError("refused"), 200]) == (200, 2)
+
+
+def test_post_is_not_resent_after_a_read_timeout():
+    with pytest.raises(httpx.ReadTimeout):
+        send("POST", [httpx.ReadTimeout("slow"), 200])
@@ -0,0 +1,162 @@
+import asyncio
+import itertools
+import json
+
+import httpx
+import pytest
+from starlette.exceptions import HTTPException
+
+from app.core import epm_functions
+from app.core.epm_client import EpmClient
+from app.core.epm_functions import (export_data_slice_json, import_batches_concurrently, merge_export_slices,
+                                    plan_export_slices)
+from app.core.export_cache import ExportCache
+
+BASE_URL = "https://epm.example.com"
+ENTITIES = [f"E{i}" for i in range(6)]
+PERIODS = ["Jan", "Feb", "Mar"]
+
+
+def grid_definition():
+    return {
+        "suppressMissingBlocks": True,
+        "pov": {"dimensions": ["Scenario", "Version"], "members": [["Actual", "Plan"], ["Working"]]},
+        "columns": [{"dimensions": ["Period"], "members": [PERIODS]}],
+        "rows": [{"dimensions": ["Entity", "Account"], "members": [ENTITIES, ["Sales"]]}],
+    }
+
+
+def mock_epm(failures=None):
+    """
+    MockTransport answering exportdataslice like EPM: one row per row member
+    combination, suppressing the Mar column for entities after E2. `failures` maps
+    an entity to the status codes returned, in turn, for the sub-slice starting there.
+    """
+    failures = {entity: list(codes) for entity, codes in (failures or {}).items()}
+    requests = []
+
+    def handler(request):
+        grid = json.loads(request.content)["gridDefinition"]
+        requests.append(grid)
+        entities = grid["rows"][0]["members"][0]
+        codes = failures.get(entities[0])
+        if codes:
+            return httpx.Response(codes.pop(0), text="EPM unavailable")
+
+        scenario = grid["pov"]["members"][0][0]
+        periods = PERIODS if entities[0] in ENTITIES[:3] else PERIODS[:2]
+        rows = [{"headers": list(members), "data": [f"{ENTITIES.index(members[0])}.{i}" for i in range(len(periods))]}
+                for segment in grid["rows"] for members in itertools.product(*segment["members"])]
+        return httpx.Response(200, json={"pov": [scenario, "Working"], "columns": [periods], "rows": rows})
+
+    return httpx.MockTransport(handler), requests
+
+
+def export(transport, monkeypatch, username="user", password="password", **options):
+    async def run():
+        client = EpmClient(transport=transport, backoff_factor=0)
+        monkeypatch.setattr(epm_functions, "get_epm_client", lambda: client)
+        try:
+            return await export_data_slice_json(BASE_URL, username, password, "App", "v3", "Plan1",
+                                                json.dumps({"gridDefinition": grid_definition()}), **options)
+        finally:
+            await client.aclose()
+
+    return asyncio.run(run())
+
+
+def test_plan_export_slices_keeps_small_grids_whole():
+    assert plan_export_slices(grid_definition(), 100) == [(None, grid_definition())]
+
+
+def test_plan_export_slices_splits_rows_under_budget():
+    slices = plan_export_slices(grid_definition(), 9)
+    assert [grid["rows"][0]["members"][0] for _, grid in slices] == [ENTITIES[:3], ENTITIES[3:]]
+
+
+def test_split_export_merges_sub_slices(monkeypatch):
+    transport, requests = mock_epm()
+    single = export(transport, monkeypatch)["data"]
+    merged = export(transport, monkeypatch, max_cells=6, max_workers=2)["data"]
+
+    assert len(requests) == 1 + 3
+    assert merged["columns"] == [PERIODS]
+    assert [row["headers"] for row in merged["rows"]] == [row["headers"] for row in single["rows"]]
+    # Cells a sub-slice suppressed are filled in as a single export would report them
+    assert merged["rows"][-1]["data"] == ["5.0", "5.1", "#Missing"]
+
+
+def test_split_export_by_pov_prefixes_rows(monkeypatch):
+    transport, _ = mock_epm()
+    merged = export(transport, monkeypatch, max_cells=100, split_dimension="Scenario")["data"]
+    assert [row["headers"][0] for row in merged["rows"]] == ["Actual"] * 6 + ["Plan"] * 6
+    # The split dimension moved to the row headers, so only Version is left in the POV
+    assert merged["pov"] == ["Working"]
+
+
+def sub_slice(periods, entity):
+    return {"pov": ["Actual", "Working"], "columns": [periods],
+            "rows": [{"headers": [entity, "Sales"], "data": [f"{entity}.{period}" for period in periods]}]}
+
+
+def test_merge_export_slices_orders_columns_as_requested():
+    # The first sub-slice suppressed Jan, which a first-seen order would put last
+    results = [(None, sub_slice(["Feb", "Mar"], "E0")), (None, sub_slice(["Mar", "Jan"], "E1"))]
+    merged = merge_export_slices(results, grid_definition())
+
+    assert merged["columns"] == [PERIODS]
+    assert [row["data"] for row in merged["rows"]] == [["#Missing", "E0.Feb", "E0.Mar"],
+                                                       ["E1.Jan", "#Missing", "E1.Mar"]]
+
+
+def test_merge_export_slices_places_expanded_member_functions_in_response_order():
+    grid = dict(grid_definition(), columns=[{"dimensions": ["Period"], "members": [["ILvl0Descendants(Q1)"]]}])
+    results = [(None, sub_slice(["Feb", "Mar"], "E0")), (None, sub_slice(["Jan", "Feb"], "E1"))]
+    assert merge_export_slices(results, grid)["columns"] == [PERIODS]
+
+
+def test_split_export_retries_failed_sub_slice(monkeypatch):
+    transport, requests = mock_epm({"E2": [503, 503]})
+    merged = export(transport, monkeypatch, max_cells=6)["data"]
+
+    assert len(requests) == 3 + 2
+    assert [row["headers"][0] for row in merged["rows"]] == ENTITIES
+
+
+def test_split_export_fails_when_sub_slice_keeps_failing(monkeypatch):
+    transport, _ = mock_epm({"E2": [500]})
+    with pytest.raises(HTTPException) as raised:
+        export(transport, monkeypatch, max_cells=6)
+    assert raised.value.status_code == 500
+
+
+def test_cached_export_is_only_served_to_the_same_credentials(monkeypatch):
+    monkeypatch.setattr(epm_functions, "export_cache", ExportCache())
+    transport, requests = mock_epm()
+    first = export(transport, monkeypatch, cache=True)
+    assert export(transport, monkeypatch, cache=True) == first
+    assert len(requests) == 1
+
+    export(transport, monkeypatch, username="someoneelse", password="wrong", cache=True)
+    assert len(requests) == 2
+
+
+def test_failed_import_batch_is_only_retried_by_the_batch_loop(monkeypatch):
+    posts = []
+
+    def handler(request):
+        posts.append(request)
+        return httpx.Response(503, text="EPM unavailable")
+
+    async def run():
+        client = EpmClient(transport=httpx.MockTransport(handler), backoff_factor=0)
+        monkeypatch.setattr(epm_functions, "get_epm_client", lambda: client)
+        try:
+            return await import_batches_concurrently(f"{BASE_URL}/importdataslice", "user", "password",
+                                                     [{"dataGrid": {"rows": [[1]]}}], max_retries=2)
+        finally:
+            await client.aclose()
+
+    result = asyncio.run(run())
+    assert result["status"] == "failed"
+    assert len(posts) == 3
@@ -0,0 +1,90 @@
+import os
+
+from app.core import export_cache as export_cache_module
+from app.core.export_cache import ExportCache, export_cache_key
+
+GRID = {"rows": [{"dimensions": ["Entity"], "members": [["E1"]]}]}
+
+
+def key(plan_type_name="Plan1", payload=None, username="user", password="password", **options):
+    return export_cache_key("https://epm.example.com", "App", plan_type_name, payload or {"gridDefinition": GRID},
+                            username, password, **options)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+def test_key_ignores_payload_formatting_but_not_content():
+    assert key(payload={"gridDefinition": GRID, "exportPlanningData": False}) == \
+        key(payload={"exportPlanningData": False, "gridDefinition": GRID})
+    assert key(payload={"gridDefinition": GRID, "exportPlanningData": True}) != \
+        key(payload={"gridDefinition": GRID, "exportPlanningData": False})
+    assert key(max_cells=10) != key()
+
+
+def test_key_depends_on_credentials():
+    assert key(username="someoneelse") != key()
+    assert key(password="wrong") != key()
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(export_cache_module.time, "time", clock.time)
+    cache = ExportCache(ttl=60)
+    cache.put(key(), {"rows": []})
+
+    clock.now += 59
+    assert cache.get(key()) == {"rows": []}
+    clock.now += 2
+    assert cache.get(key()) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ExportCache(max_entries=2)
+    cache.put(key("A"), "a")
+    cache.put(key("B"), "b")
+    assert cache.get(key("A")) == "a"
+    cache.put(key("C"), "c")
+
+    assert cache.get(key("B")) is None
+    assert cache.get(key("A")) == "a"
+    assert cache.get(key("C")) == "c"
+
+
+def test_disk_tier_survives_the_process(tmp_path):
+    ExportCache(directory=str(tmp_path)).put(key(), {"rows": [1]})
+
+    cache = ExportCache(directory=str(tmp_path))
+    assert cache.get(key()) == {"rows": [1]}
+    assert cache.hits == 1
+
+
+def test_expired_disk_entries_are_removed(tmp_path, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(export_cache_module.time, "time", clock.time)
+    ExportCache(ttl=60, directory=str(tmp_path)).put(key(), "a")
+
+    clock.now += 61
+    assert ExportCache(ttl=60, directory=str(tmp_path)).get(key()) is None
+    assert os.listdir(tmp_path) == []
+
+
+def test_invalidate_drops_only_that_plan_type(tmp_path):
+    cache = ExportCache(directory=str(tmp_path))
+    cache.put(key("Plan1"), "one")
+    cache.put(key("Plan1", max_cells=10), "split")
+    cache.put(key("Plan2"), "two")
+
+    cache.invalidate("https://epm.example.com/", "App", "Plan1")
+
+    assert cache.get(key("Plan1")) is None
+    assert cache.get(key("Plan1", max_cells=10)) is None
+    assert cache.get(key("Plan2")) == "two"
+    assert len(os.listdir(tmp_path)) == 1
+    assert ExportCache(directory=str(tmp_path)).get(key("Plan1")) is None
@@ -0,0 +1,71 @@
+import json
+
+import httpx
+import numpy as np
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.endpoints import reconcile_endpoints
+from app.core import epm_functions
+from app.core.epm_client import EpmClient
+from app.core.reconcile_functions import grid_to_dataframe
+from tests.test_epm_functions import BASE_URL, ENTITIES, PERIODS, export, grid_definition, mock_epm
+
+ROW_DIMENSIONS = ['Entity', 'Account']
+
+
+def test_grid_to_dataframe_reads_a_merged_export(monkeypatch):
+    transport, _ = mock_epm()
+    df = grid_to_dataframe(export(transport, monkeypatch, max_cells=6)["data"], ROW_DIMENSIONS)
+
+    assert df.columns.tolist() == ROW_DIMENSIONS + PERIODS
+    assert df['Entity'].tolist() == ENTITIES
+    assert df['Entity'].dtype == 'category' and df['Jan'].dtype == np.float64
+    assert df.loc[0].tolist() == ['E0', 'Sales', 0.0, 0.1, 0.2]
+    # The cells the last sub-slice suppressed are missing, not zero
+    assert df['Mar'].isna().tolist() == [False] * 4 + [True] * 2
+
+
+@pytest.fixture
+def reconcile_client(monkeypatch):
+    def client_for(handler):
+        client = EpmClient(transport=httpx.MockTransport(handler), max_retries=1, backoff_factor=0)
+        monkeypatch.setattr(epm_functions, "get_epm_client", lambda: client)
+        app = FastAPI()
+        app.include_router(reconcile_endpoints.router, prefix="/reconcile")
+        return TestClient(app)
+
+    return client_for
+
+
+def post_reconcile(client, tmp_path):
+    return client.post("/reconcile/", data={
+        "src_base_url": BASE_URL, "src_username": "user", "src_password": "password", "src_app_name": "App",
+        "src_api_version": "v3", "src_plan_type_name": "Plan1",
+        "src_payload": json.dumps({"gridDefinition": grid_definition()}),
+        "excel_path": str(tmp_path / "reconcile.xlsx"), "row_dimensions": ROW_DIMENSIONS,
+    })
+
+
+def test_reconcile_compares_both_exports(reconcile_client, tmp_path):
+    transport, requests = mock_epm()
+    response = post_reconcile(reconcile_client(transport.handler), tmp_path)
+
+    assert response.status_code == 200
+    assert response.json()["status_code"] == 200
+    assert response.json()["source_rows"] == response.json()["target_rows"] == len(ENTITIES)
+    assert len(requests) == 2
+
+
+def test_reconcile_keeps_the_epm_status_code(reconcile_client, tmp_path):
+    response = post_reconcile(reconcile_client(lambda request: httpx.Response(401, text="Unauthorized")), tmp_path)
+    assert response.status_code == 401
+
+
+def test_reconcile_reports_epm_timeouts_as_gateway_timeouts(reconcile_client, tmp_path):
+    def handler(request):
+        raise httpx.ReadTimeout("EPM did not answer", request=request)
+
+    response = post_reconcile(reconcile_client(handler), tmp_path)
+    assert response.status_code == 504
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+
+from app.core.compare_functions import key_hashes
+from app.core.snapshot_functions import SnapshotStore, build_snapshot, diff_snapshots, select_changed_rows
+
+ROW_DIMENSIONS = ['Entity', 'Account']
+
+
+def extract(rows):
+    return pd.DataFrame(rows, columns=ROW_DIMENSIONS + ['Jan'])
+
+
+SOURCE = extract([('E1', 'Sales', 1.0), ('E2', 'Sales', 2.0), ('E2', 'Sales', 3.0), ('E3', 'Costs', 4.0)])
+TARGET = extract([('E1', 'Sales', 1.0), ('E2', 'Sales', 2.0), ('E3', 'Costs', 4.0)])
+
+
+def keys(*members):
+    return set(key_hashes(extract([member + (0.0,) for member in members]), ROW_DIMENSIONS).tolist())
+
+
+def test_diff_snapshots_reports_nothing_for_a_rerun_with_repeated_intersections():
+    previous = build_snapshot(SOURCE, TARGET, ROW_DIMENSIONS)
+    # Same rows, with the repeated E2/Sales intersection in the opposite order
+    current = build_snapshot(SOURCE.iloc[[0, 2, 1, 3]], TARGET, ROW_DIMENSIONS)
+
+    changed_keys, stats = diff_snapshots(previous, current)
+    assert len(changed_keys) == 0
+    assert stats == {side: {'added': 0, 'removed': 0, 'changed': 0} for side in ('source', 'target')}
+
+
+def test_diff_snapshots_reports_added_removed_and_changed_intersections():
+    previous = build_snapshot(SOURCE, TARGET, ROW_DIMENSIONS)
+    source = extract([('E1', 'Sales', 1.0), ('E2', 'Sales', 2.0), ('E2', 'Sales', 5.0), ('E4', 'Sales', 6.0)])
+    target = extract([('E1', 'Sales', 9.0), ('E2', 'Sales', 2.0), ('E2', 'Sales', 2.0), ('E3', 'Costs', 4.0)])
+
+    changed_keys, stats = diff_snapshots(previous, build_snapshot(source, target, ROW_DIMENSIONS))
+    assert stats == {'source': {'added': 1, 'removed': 1, 'changed': 1},
+                     'target': {'added': 0, 'removed': 0, 'changed': 2}}
+    assert set(changed_keys.tolist()) == keys(('E1', 'Sales'), ('E2', 'Sales'), ('E3', 'Costs'), ('E4', 'Sales'))
+
+
+def test_select_changed_rows_keeps_only_changed_intersections(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    df_source, df_target, snapshot = select_changed_rows(SOURCE, TARGET, ROW_DIMENSIONS, store, 'app/plan')
+    assert len(df_source) == len(SOURCE) and len(df_target) == len(TARGET)
+    store.save('app/plan', snapshot)
+
+    target = TARGET.copy()
+    target.loc[2, 'Jan'] = 40.0
+    df_source, df_target, _ = select_changed_rows(SOURCE, target, ROW_DIMENSIONS, store, 'app/plan')
+    assert df_source.values.tolist() == [['E3', 'Costs', 4.0]]
+    assert df_target.values.tolist() == [['E3', 'Costs', 40.0]]
+    assert np.array_equal(store.load('app/plan')['row_hash'], snapshot['row_hash'])
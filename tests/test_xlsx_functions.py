@@ -0,0 +1,107 @@
+from io import StringIO
+
+import pandas as pd
+import pytest
+
+from app.core.xlsx_functions import EPM_MISSING_VALUES, save_to_excel_with_hash_check
+
+ROW_DIMENSIONS = ['Entity', 'Account']
+
+# Two header rows; covers mismatches, one-sided rows and cells, a missing Entity
+# member and a key repeated on the source side
+SOURCE_CSV = """Entity,Account,Jan,Feb,Mar
+,,Actual,Actual,Actual
+E1,Sales,100,200,300
+E1,Costs,50,#Missing,70
+E2,Sales,10,20,30
+E2,Sales,11,21,31
+E3,Sales,1,2,3
+,Sales,5,6,7
+E4,Costs,#Missing,#Missing,9
+"""
+TARGET_CSV = """Entity,Account,Jan,Feb,Mar
+,,Actual,Actual,Actual
+E1,Sales,100,200,301
+E1,Costs,50,60,70
+E2,Sales,10,20,30
+E5,Sales,8,#Missing,8
+,Sales,5,6,7
+E4,Costs,#Missing,1,9
+"""
+
+MODES = {
+    'streaming': {'streaming': True},
+    'workers': {'workers': 2},
+    'long': {'long_format': True},
+    'long_workers': {'long_format': True, 'workers': 2, 'streaming': True},
+}
+
+
+def read_extract(csv_text):
+    df = pd.read_csv(StringIO(csv_text), skiprows=2, header=None, na_values=EPM_MISSING_VALUES)
+    df.columns = ROW_DIMENSIONS + ['Jan_Actual', 'Feb_Actual', 'Mar_Actual']
+    return df
+
+
+def baseline_comparison(df_source, df_target):
+    """
+    The comparison as the original row-wise implementation computed it.
+    """
+    comparison_df = df_source.set_index(ROW_DIMENSIONS).join(df_target.set_index(ROW_DIMENSIONS), how='outer',
+                                                             lsuffix='_source', rsuffix='_target')
+    for col in [c.rsplit('_', 1)[0] for c in comparison_df.columns if c.endswith('_source')]:
+        source_col, target_col = f'{col}_source', f'{col}_target'
+        comparison_df[f'{col}_variance'] = comparison_df[source_col].sub(comparison_df[target_col], fill_value=0)
+        comparison_df[f'{col}_notes'] = comparison_df.apply(
+            lambda row: 'Data Match' if row[source_col] == row[target_col]
+            else 'Values do not match' if not pd.isna(row[source_col]) and not pd.isna(row[target_col])
+            else 'Data exists in source, not in target' if pd.isna(row[target_col])
+            else 'Data exists in target, not in source', axis=1)
+    comparison_df['rowfailure'] = comparison_df.apply(
+        lambda row: 'fail' if any(row[c] != 0 for c in row.index if '_variance' in c) else 'success', axis=1)
+    return comparison_df.reset_index()
+
+
+def normalize(df):
+    """
+    Compare frames by content: numeric columns as float64, everything else as objects
+    with None for missing values.
+    """
+    df = df.reset_index(drop=True)
+    for col in df.columns:
+        if pd.api.types.is_numeric_dtype(df[col]):
+            df[col] = df[col].astype('float64')
+        else:
+            df[col] = df[col].astype(object).where(df[col].notna(), None)
+    return df
+
+
+def run_comparison(tmp_path, name, **options):
+    excel_path = str(tmp_path / f"{name}.xlsx")
+    status_code = save_to_excel_with_hash_check(SOURCE_CSV, TARGET_CSV, excel_path, 2, 2, ROW_DIMENSIONS, **options)
+    sheets = pd.read_excel(excel_path, sheet_name=None)
+    return status_code, {name: normalize(sheets[name]) for name in ('Source', 'Target', 'Validation')}
+
+
+@pytest.fixture(scope='module')
+def default_output(tmp_path_factory):
+    return run_comparison(tmp_path_factory.mktemp('default'), 'default')
+
+
+def test_default_matches_baseline_comparison(default_output):
+    status_code, sheets = default_output
+    expected = baseline_comparison(read_extract(SOURCE_CSV), read_extract(TARGET_CSV))
+
+    assert status_code == 412
+    pd.testing.assert_frame_equal(sheets['Source'], normalize(read_extract(SOURCE_CSV)))
+    pd.testing.assert_frame_equal(sheets['Target'], normalize(read_extract(TARGET_CSV)))
+    pd.testing.assert_frame_equal(sheets['Validation'], normalize(expected[sheets['Validation'].columns]))
+
+
+@pytest.mark.parametrize('mode', MODES)
+def test_modes_match_default_output(tmp_path, default_output, mode):
+    status_code, sheets = run_comparison(tmp_path, mode, **MODES[mode])
+
+    assert status_code == default_output[0]
+    for name, df in default_output[1].items():
+        pd.testing.assert_frame_equal(sheets[name], df)